@@ -13,18 +13,199 @@ An empty board will be displayed, and the following commands are available:
  Space or Enter : Toggle the contents of the cursor's position
 
 Contributed by Andrew Kuchling, Mouse support and color by Dafydd Crosby.
+
+The generations are computed by a LifeEngine, which doesn't need curses;
+with NumPy installed the board is kept in an array.  To time generations
+without a screen, run
+
+    life.py --bench [size [generations]]
+
+which steps a random size by size board (default 4096) and prints the
+generations per second.
 """
 
+import sys
+import time
 import curses
 import random
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class LifeEngine:
+    """The cells of a Life board, and the rules, without any display.
+
+    Cells outside the X by Y board are always dead.  This engine keeps the
+    set of live (x, y) cells, and only looks at them and their neighbours,
+    so it suits sparse boards and works without NumPy.
+
+    Methods:
+    clear() -- kill every cell
+    randomize(density) -- make each cell live with the given probability
+    set(x, y, live) -- make a cell live or dead
+    alive(x, y) -- return whether a cell is live
+    live() -- return a list of the (x, y) of the live cells
+    population() -- return the number of live cells
+    step(changes) -- compute the next generation; if changes is true,
+                     return the lists of the (x, y) of the cells born
+                     and of those that died
+    """
+
+    NEIGHBOURS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+                  if dx or dy]
+
+    def __init__(self, X, Y):
+        self.X, self.Y = X, Y
+        self.generation = 0
+        self.cells = set()
+
+    def clear(self):
+        self.cells = set()
+
+    def randomize(self, density=0.5):
+        self.cells = {(x, y) for x in range(self.X) for y in range(self.Y)
+                      if random.random() < density}
+
+    def set(self, x, y, live=True):
+        if live:
+            self.cells.add((x, y))
+        else:
+            self.cells.discard((x, y))
+
+    def alive(self, x, y):
+        return (x, y) in self.cells
+
+    def live(self):
+        return list(self.cells)
+
+    def population(self):
+        return len(self.cells)
+
+    def step(self, changes=False):
+        X, Y = self.X, self.Y
+        counts = {}
+        for x, y in self.cells:
+            for dx, dy in self.NEIGHBOURS:
+                xy = x + dx, y + dy
+                counts[xy] = counts.get(xy, 0) + 1
+        cells = {(x, y) for (x, y), n in counts.items()
+                 if (n == 3 or n == 2 and (x, y) in self.cells)
+                 and 0 <= x < X and 0 <= y < Y}
+        result = None
+        if changes:
+            result = list(cells - self.cells), list(self.cells - cells)
+        self.cells = cells
+        self.generation += 1
+        return result
+
+
+class ArrayLifeEngine(LifeEngine):
+    """A LifeEngine keeping the board in a NumPy array of uint8.
+
+    The array has a border of dead cells, so that the neighbourhood sums
+    are plain sums of shifted views: three rows are added, then three
+    columns of that, which counts each cell with its eight neighbours.
+    All the work is done in buffers allocated once, so a generation of a
+    large board makes no temporary arrays.
+    """
+
+    def __init__(self, X, Y):
+        self.X, self.Y = X, Y
+        self.generation = 0
+        self.board = numpy.zeros((Y + 2, X + 2), numpy.uint8)
+        self.rows = numpy.empty((Y, X + 2), numpy.uint8)
+        self.sums = numpy.empty((Y, X), numpy.uint8)
+        self.next = numpy.empty((Y, X), numpy.bool_)
+        self.keep = numpy.empty((Y, X), numpy.bool_)
+
+    @property
+    def cells(self):
+        "The board without its border, indexed by [y, x]."
+        return self.board[1:-1, 1:-1]
+
+    def clear(self):
+        self.board[...] = 0
+
+    def randomize(self, density=0.5):
+        self.cells[...] = numpy.random.random((self.Y, self.X)) < density
+
+    def set(self, x, y, live=True):
+        self.cells[y, x] = live
+
+    def alive(self, x, y):
+        return bool(self.cells[y, x])
+
+    def live(self):
+        ys, xs = numpy.nonzero(self.cells)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def population(self):
+        return int(numpy.count_nonzero(self.cells))
+
+    def step(self, changes=False):
+        board, rows, sums = self.board, self.rows, self.sums
+        cells = self.cells
+        numpy.add(board[:-2], board[1:-1], out=rows)
+        rows += board[2:]
+        numpy.add(rows[:, :-2], rows[:, 1:-1], out=sums)
+        sums += rows[:, 2:]
+        # sums counts the cell itself: 3 is a birth or a survival with two
+        # neighbours, and 4 a survival with three
+        numpy.equal(sums, 3, out=self.next)
+        numpy.equal(sums, 4, out=self.keep)
+        self.keep &= cells.view(numpy.bool_)
+        self.next |= self.keep
+        result = None
+        if changes:
+            born = self.next & ~cells.view(numpy.bool_)
+            died = cells.view(numpy.bool_) & ~self.next
+            result = ([(int(x), int(y)) for y, x in zip(*numpy.nonzero(born))],
+                      [(int(x), int(y)) for y, x in zip(*numpy.nonzero(died))])
+        cells[...] = self.next
+        self.generation += 1
+        return result
+
+
+def make_engine(X, Y):
+    "Return the fastest available LifeEngine for an X by Y board."
+    if numpy is not None:
+        return ArrayLifeEngine(X, Y)
+    return LifeEngine(X, Y)
+
+
+def bench(size=4096, generations=None):
+    """Time generations of a random size by size board, without curses.
+
+    Prints the generations per second, and returns it.
+    """
+    engine = make_engine(size, size)
+    if generations is None:
+        generations = max(1, 2**29 // (size * size))
+    t0 = time.perf_counter()
+    engine.randomize()
+    t1 = time.perf_counter()
+    for i in range(generations):
+        engine.step()
+    t2 = time.perf_counter()
+    rate = generations / (t2 - t1)
+    print("%s, %dx%d board (filled in %.3f s): %d generations in %.3f s, "
+          "%.2f generations/s, %d live" %
+          (type(engine).__name__, size, size, t1 - t0, generations, t2 - t1,
+           rate, engine.population()))
+    return rate
+
 
 class LifeBoard:
     """Encapsulates a Life board
 
+    The cells are kept by a LifeEngine; the board only draws them.
+
     Attributes:
     X,Y : horizontal and vertical size of the board
-    state : dictionary mapping (x,y) to 0 or 1
+    engine : the LifeEngine holding the cells
 
     Methods:
     display(update_board) -- If update_board is true, compute the
@@ -43,10 +224,10 @@ class LifeBoard:
         scr -- curses screen object to use for display
         char -- character used to render live cells (default: '*')
         """
-        self.state = {}
         self.scr = scr
         Y, X = self.scr.getmaxyx()
         self.X, self.Y = X - 2, Y - 2 - 1
+        self.engine = make_engine(self.X, self.Y)
         self.char = char
         self.scr.clear()
 
@@ -63,82 +244,57 @@ class LifeBoard:
         """Set a cell to the live state"""
         if x < 0 or self.X <= x or y < 0 or self.Y <= y:
             raise ValueError("Coordinates out of range %i,%i" % (y, x))
-        self.state[x, y] = 1
+        self.engine.set(x, y)
 
     def toggle(self, y, x):
         """Toggle a cell's state between live and dead"""
         if x < 0 or self.X <= x or y < 0 or self.Y <= y:
             raise ValueError("Coordinates out of range %i,%i" % (y, x))
-        if (x, y) in self.state:
-            del self.state[x, y]
+        if self.engine.alive(x, y):
+            self.engine.set(x, y, False)
             self.scr.addch(y + 1, x + 1, ' ')
         else:
-            self.state[x, y] = 1
-            if curses.has_colors():
-                # Let's pick a random color!
-                self.scr.attrset(curses.color_pair(random.randrange(1, 7)))
-            self.scr.addch(y + 1, x + 1, self.char)
-            self.scr.attrset(0)
+            self.engine.set(x, y)
+            self.draw_live(x, y)
         self.scr.refresh()
 
+    def draw_live(self, x, y):
+        if curses.has_colors():
+            # Let's pick a random color!
+            self.scr.attrset(curses.color_pair(random.randrange(1, 7)))
+        self.scr.addch(y + 1, x + 1, self.char)
+        self.scr.attrset(0)
+
     def erase(self):
         """Clear the entire board and update the board display"""
-        self.state = {}
+        self.engine.clear()
         self.display(update_board=False)
 
     def display(self, update_board=True):
-        """Display the whole board, optionally computing one generation"""
-        M, N = self.X, self.Y
+        """Display the whole board, optionally computing one generation
+
+        After a generation only the cells born or dead are redrawn.
+        """
         if not update_board:
-            for i in range(0, M):
-                for j in range(0, N):
-                    if (i, j) in self.state:
-                        self.scr.addch(j + 1, i + 1, self.char)
-                    else:
-                        self.scr.addch(j + 1, i + 1, ' ')
+            blank = ' ' * self.X
+            for j in range(0, self.Y):
+                self.scr.addstr(j + 1, 1, blank)
+            for x, y in self.engine.live():
+                self.scr.addch(y + 1, x + 1, self.char)
             self.scr.refresh()
             return
 
-        d = {}
-        self.boring = 1
-        for i in range(0, M):
-            L = range(max(0, i - 1), min(M, i + 2))
-            for j in range(0, N):
-                s = 0
-                live = (i, j) in self.state
-                for k in range(max(0, j - 1), min(N, j + 2)):
-                    for l in L:
-                        if (l, k) in self.state:
-                            s += 1
-                s -= live
-                if s == 3:
-                    # Birth
-                    d[i, j] = 1
-                    if curses.has_colors():
-                        # Let's pick a random color!
-                        self.scr.attrset(curses.color_pair(
-                            random.randrange(1, 7)))
-                    self.scr.addch(j + 1, i + 1, self.char)
-                    self.scr.attrset(0)
-                    if not live:
-                        self.boring = 0
-                elif s == 2 and live:
-                    # Survival
-                    d[i, j] = 1
-                elif live:
-                    # Death
-                    self.scr.addch(j + 1, i + 1, ' ')
-                    self.boring = 0
-        self.state = d
+        born, died = self.engine.step(changes=True)
+        for x, y in born:
+            self.draw_live(x, y)
+        for x, y in died:
+            self.scr.addch(y + 1, x + 1, ' ')
+        self.boring = not born and not died
         self.scr.refresh()
 
     def make_random(self):
         "Fill the board with a random pattern"
-        self.state = {}
-        for i in range(0, self.X):
-            for j in range(0, self.Y):
-                if random.random() > 0.5:
-                    self.set(j, i)
+        self.engine.randomize(0.5)
 
 
 def erase_menu(stdscr, menu_y):
@@ -259,4 +415,7 @@ def main(stdscr):
     keyloop(stdscr)                 # Enter the main loop
 
 if __name__ == '__main__':
-    curses.wrapper(main)
+    if sys.argv[1:2] == ['--bench']:
+        bench(*[int(arg) for arg in sys.argv[2:4]])
+    else:
+        curses.wrapper(main)
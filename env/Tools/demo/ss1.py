@@ -4,12 +4,27 @@
 SS1 -- a spreadsheet-like application.
 """
 
+import gc
+import io
 import os
 import re
+import csv
 import sys
+import math
+import time
+import array
+import bisect
+import marshal
+import functools
+import contextlib
 from xml.parsers import expat
 from xml.sax.saxutils import escape
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 LEFT, CENTER, RIGHT = "LEFT", "CENTER", "RIGHT"
 
 def ljust(x, n):
@@ -25,58 +40,293 @@ xml2align = {"left": LEFT, "center": CENTER, "right": RIGHT}
 
 align2anchor = {LEFT: "w", CENTER: "center", RIGHT: "e"}
 
+# Number of cells written, read or inserted at a time when loading or saving
+CHUNK = 10000
+
+# Files with this suffix hold the sheet's values as CSV; see Sheet.readcsv()
+CSV_SUFFIX = ".csv"
+
+# The binary sheet format; see Sheet.writebinary()
+BINARY_SUFFIX = ".ss1b"
+BINARY_MAGIC = b"SS1 binary sheet 1\n"
+BINARY_TYPES = {int: b'i', bool: b'i', float: b'f', complex: b'c'}
+BINARY_KINDS = {c: bytes([c]) for c in b'ifcs='}
+BINARY_DEFAULTS = {b'i': ("%s", RIGHT), b'f': ("%s", RIGHT),
+                   b'c': ("%s", RIGHT), b's': ("%s", LEFT),
+                   b'=': ("%s", RIGHT)}
+
 def sum(seq):
+    if isinstance(seq, CellRange):
+        return seq.sum()
     total = 0
     for x in seq:
         if x is not None:
             total += x
     return total
 
+def count(seq):
+    "Return the number of values in seq that aren't None."
+    if isinstance(seq, CellRange):
+        return seq.count()
+    n = 0
+    for x in seq:
+        if x is not None:
+            n += 1
+    return n
+
+def average(seq):
+    if isinstance(seq, CellRange):
+        return seq.average()
+    return sum(seq) / count(seq)
+
+def rangemin(*args):
+    "The min() of formulas; the minimum of a cell range ignores empty cells."
+    if len(args) == 1 and isinstance(args[0], CellRange):
+        return args[0].min()
+    return min(*args)
+
+def rangemax(*args):
+    "The max() of formulas; the maximum of a cell range ignores empty cells."
+    if len(args) == 1 and isinstance(args[0], CellRange):
+        return args[0].max()
+    return max(*args)
+
 class Sheet:
 
+    # recalc() only uses a process pool for at least this many formulas
+    PARALLEL = 5000
+
     def __init__(self):
-        self.cells = {} # {(x, y): cell, ...}
+        self.cells = SparseGrid() # {(x, y): cell, ...}
+        self.graph = DependencyGraph()
+        self.changed = None # cells set since the last recalc; None means all
+        self.timings = {} # statistics of the last recalc
+        self.cycles = [] # reference cycles found by the last recalc
+        self.evaluating = False # true while evaluate() runs
+        self.profile = None # {(x, y): seconds, ...} if profiling
+        self.rangeindex = RangeIndex()
         self.ns = dict(
             cell = self.cellvalue,
             cells = self.multicellvalue,
             sum = sum,
+            count = count,
+            average = average,
+            min = rangemin,
+            max = rangemax,
         )
 
     def cellvalue(self, x, y):
-        cell = self.getcell(x, y)
+        cell = self.cells.data.get((x, y))
         if hasattr(cell, 'recalc'):
+            if not cell.valid:
+                if self.evaluating:
+                    raise NeedValue((x, y))
+                self.evaluate([(x, y)])
             return cell.recalc(self.ns)
         else:
             return cell
 
+    def evaluate(self, order):
+        """Evaluate the formula cells at the coordinates in order.
+
+        No recursion is involved, so chains of references can be any length.
+        A formula that needs the value of another formula not yet evaluated
+        is abandoned (cellvalue() raises NeedValue), the other formula and
+        its references are pushed on an explicit stack, and the first formula
+        is tried again once they are done.  If the needed formula is already
+        on the stack the formulas form a cycle: each of them gets the value
+        'CycleError', and the cycle is added to self.cycles.
+
+        Only formulas that really refer to each other are reported as a
+        cycle; formulas that merely wait on the stack alongside are left to
+        be evaluated normally.
+
+        Formulas are tried in the given order first, so when that is a
+        topological order (as recalc() gives) nothing is abandoned unless
+        there are cycles, or volatile formulas whose references aren't
+        known in advance.
+        """
+        cells = self.cells
+        ns = self.ns
+        profile = self.profile
+        saved = self.evaluating
+        self.evaluating = True
+        try:
+            for xy in order:
+                cell = cells.get(xy)
+                if getattr(cell, 'valid', True):
+                    continue
+                try:
+                    if profile is None:
+                        cell.recalc(ns)
+                    else:
+                        self.timedrecalc(xy, cell)
+                except NeedValue as e:
+                    self.evaluatestack(xy, e.args[0])
+        finally:
+            self.evaluating = saved
+
+    def evaluatestack(self, xy, need):
+        cells = self.cells
+        ns = self.ns
+        stack = [xy]
+        active = {xy}
+        waiting = {xy: need} # {(x, y): the cell it last needed, ...}
+        while stack:
+            if need is not None:
+                if need in active:
+                    cycle = self.waitcycle(need, active, waiting)
+                    if cycle:
+                        self.cycles.append([cellname(*c) for c in cycle])
+                        for c in cycle:
+                            cells[c].fail(CycleError)
+                    else:
+                        # Pushed as a sibling and not tried yet: try it now
+                        stack.remove(need)
+                        stack.append(need)
+                else:
+                    # Also push the other formulas the abandoned one refers
+                    # to, to save retries
+                    for p in self.precedents(stack[-1]):
+                        if p != need and p not in active:
+                            stack.append(p)
+                            active.add(p)
+                    stack.append(need)
+                    active.add(need)
+                need = None
+            top = stack[-1]
+            cell = cells[top]
+            if cell.valid:
+                stack.pop()
+                active.discard(top)
+                continue
+            try:
+                if self.profile is None:
+                    cell.recalc(ns)
+                else:
+                    self.timedrecalc(top, cell)
+            except NeedValue as e:
+                need = waiting[top] = e.args[0]
+            else:
+                stack.pop()
+                active.discard(top)
+
+    def waitcycle(self, need, active, waiting):
+        """Return the cycle of formulas waiting for each other through need.
+
+        Following waiting from need, through formulas still on the stack
+        and not yet evaluated, either leads back to need, and the formulas
+        on the way refer to each other in a cycle, or it doesn't, and the
+        empty list is returned.
+        """
+        cycle = [need]
+        seen = {need}
+        xy = waiting.get(need)
+        while xy != need:
+            if (xy is None or xy in seen or xy not in active or
+                self.cells[xy].valid):
+                return []
+            cycle.append(xy)
+            seen.add(xy)
+            xy = waiting.get(xy)
+        return cycle
+
+    def timedrecalc(self, xy, cell):
+        "Evaluate the formula at xy, adding the time taken to self.profile."
+        t = time.perf_counter()
+        try:
+            cell.recalc(self.ns)
+        finally:
+            self.profile[xy] = (self.profile.get(xy, 0.0) +
+                                time.perf_counter() - t)
+
+    def hotspots(self, n=10):
+        """Return the n formulas that took longest to evaluate.
+
+        Profiling is off by default; set self.profile to {} to turn it on.
+        Every evaluation of a formula by evaluate() is timed, including the
+        attempts abandoned for want of another formula's value, and the
+        times add up until self.profile is cleared.  Formulas evaluated on
+        a process pool by recalc() aren't timed.  Returns a list of
+        (seconds, cell name, formula), slowest first.
+        """
+        found = []
+        for (x, y), seconds in self.profile.items():
+            cell = self.cells.get((x, y))
+            if hasattr(cell, 'formula'):
+                found.append((seconds, cellname(x, y), cell.formula))
+        found.sort(key=lambda item: -item[0])
+        return found[:n]
+
+    def precedents(self, xy):
+        "Return the formula cells not yet evaluated that xy refers to."
+        found = []
+        for x1, y1, x2, y2 in self.graph.precedents.get(xy, ()):
+            if x1 == x2 and y1 == y2:
+                keys = [(x1, y1)] if (x1, y1) in self.rangeindex.formulas \
+                       else ()
+            else:
+                keys = self.rangeindex.formulas.select(x1, y1, x2, y2)
+            for p in keys:
+                if not self.cells[p].valid:
+                    found.append(p)
+        return found
+
     def multicellvalue(self, x1, y1, x2, y2):
-        if x1 > x2:
-            x1, x2 = x2, x1
-        if y1 > y2:
-            y1, y2 = y2, y1
-        seq = []
-        for y in range(y1, y2+1):
-            for x in range(x1, x2+1):
-                seq.append(self.cellvalue(x, y))
-        return seq
+        return CellRange(self, x1, y1, x2, y2)
 
     def getcell(self, x, y):
         return self.cells.get((x, y))
 
+    def setcells(self, items):
+        """Set many cells at once, from ((x, y), cell) pairs.
+
+        Unlike setcell(), the coordinates and cells aren't checked.
+        """
+        items = list(items)
+        self.cells.update(items)
+        graph = self.graph
+        for (x, y), cell in items:
+            if (x, y) in graph.precedents:
+                graph.remove((x, y))
+            if hasattr(cell, 'refs'):
+                graph.add((x, y), cell.refs, cell.volatile)
+        self.rangeindex.setmany(items)
+        if self.changed is not None:
+            self.changed.update([xy for xy, cell in items])
+
     def setcell(self, x, y, cell):
         assert x > 0 and y > 0
         assert isinstance(cell, BaseCell)
         self.cells[x, y] = cell
+        self.graph.remove((x, y))
+        if hasattr(cell, 'refs'):
+            self.graph.add((x, y), cell.refs, cell.volatile)
+        self.rangeindex.set(x, y, cell)
+        self.touch(x, y)
 
     def clearcell(self, x, y):
         try:
             del self.cells[x, y]
         except KeyError:
             pass
+        else:
+            self.graph.remove((x, y))
+            self.rangeindex.set(x, y, None)
+            self.touch(x, y)
 
     def clearcells(self, x1, y1, x2, y2):
-        for xy in self.selectcells(x1, y1, x2, y2):
-            del self.cells[xy]
+        keys = self.selectcells(x1, y1, x2, y2)
+        self.cells.popmany(keys)
+        for xy in keys:
+            self.graph.remove(xy)
+            self.rangeindex.set(xy[0], xy[1], None)
+            self.touch(*xy)
+
+    def touch(self, x, y):
+        "Note that (x, y) changed, so recalc() updates the cells using it."
+        if self.changed is not None:
+            self.changed.add((x, y))
 
     def clearrows(self, y1, y2):
         self.clearcells(0, y1, sys.maxsize, y2)
@@ -85,31 +335,50 @@ class Sheet:
         self.clearcells(x1, 0, x2, sys.maxsize)
 
     def selectcells(self, x1, y1, x2, y2):
-        if x1 > x2:
-            x1, x2 = x2, x1
-        if y1 > y2:
-            y1, y2 = y2, y1
-        return [(x, y) for x, y in self.cells
-                if x1 <= x <= x2 and y1 <= y <= y2]
+        return self.cells.select(x1, y1, x2, y2)
 
     def movecells(self, x1, y1, x2, y2, dx, dy):
+        """Move the cells in a rectangle by (dx, dy).
+
+        Only the moved cells and the formulas referring to the rectangle are
+        touched, whatever the size of the sheet.
+        """
         if dx == 0 and dy == 0:
             return
         if x1 > x2:
             x1, x2 = x2, x1
         if y1 > y2:
             y1, y2 = y2, y1
-        assert x1+dx > 0 and y1+dy > 0
-        new = {}
-        for x, y in self.cells:
-            cell = self.cells[x, y]
-            if hasattr(cell, 'renumber'):
-                cell = cell.renumber(x1, y1, x2, y2, dx, dy)
-            if x1 <= x <= x2 and y1 <= y <= y2:
-                x += dx
-                y += dy
-            new[x, y] = cell
-        self.cells = new
+        assert max(x1, 1)+dx > 0 and max(y1, 1)+dy > 0
+        # Renumber the formulas referring into the rectangle
+        for xy in self.graph.referring(x1, y1, x2, y2):
+            cell = self.cells[xy].renumber(x1, y1, x2, y2, dx, dy)
+            self.cells[xy] = cell
+            self.graph.remove(xy)
+            self.graph.add(xy, cell.refs, cell.volatile)
+            self.touch(*xy)
+        keys = self.cells.select(x1, y1, x2, y2)
+        moved = self.cells.popmany(keys)
+        for xy in keys:
+            self.graph.remove(xy)
+            self.rangeindex.set(xy[0], xy[1], None)
+            self.touch(*xy)
+        moved = [((x+dx, y+dy), cell) for (x, y), cell in zip(keys, moved)]
+        for xy, cell in moved:
+            self.graph.remove(xy)
+            if hasattr(cell, 'refs'):
+                self.graph.add(xy, cell.refs, cell.volatile)
+            self.rangeindex.set(xy[0], xy[1], cell)
+            self.touch(*xy)
+        self.cells.update(moved)
+
+    def rebuild(self):
+        "Rebuild the dependency graph; the next recalc() recomputes all."
+        self.graph.clear()
+        for xy, cell in self.cells.items():
+            if hasattr(cell, 'refs'):
+                self.graph.add(xy, cell.refs, cell.volatile)
+        self.changed = None
 
     def insertrows(self, y, n):
         assert n > 0
@@ -128,111 +397,1076 @@ class Sheet:
     def deletecolumns(self, x1, x2):
         if x1 > x2:
             x1, x2 = x2, x1
-        self.clearcells(x1, x2)
+        self.clearcolumns(x1, x2)
         self.movecells(x2+1, 0, sys.maxsize, sys.maxsize, x1-x2-1, 0)
 
     def getsize(self):
-        maxx = maxy = 0
-        for x, y in self.cells:
-            maxx = max(maxx, x)
-            maxy = max(maxy, y)
-        return maxx, maxy
+        return self.cells.extent()
 
     def reset(self):
         for cell in self.cells.values():
             if hasattr(cell, 'reset'):
                 cell.reset()
 
-    def recalc(self):
-        self.reset()
-        for cell in self.cells.values():
-            if hasattr(cell, 'recalc'):
-                cell.recalc(self.ns)
+    def recalc(self, pool=None, tasks=None):
+        """Bring formula values up to date.
+
+        Only the formulas that depend, directly or indirectly, on cells set
+        or cleared since the last recalc() are reset, and they are evaluated
+        in topological order.  After movecells() everything is recomputed.
+
+        If pool, a concurrent.futures executor, is given and there are at
+        least PARALLEL formulas to evaluate, the formulas are split into
+        groups that don't refer to each other, and these are evaluated on
+        the pool, in about tasks batches (four per CPU by default).
+        """
+        if self.changed is None:
+            self.reset()
+            order = self.graph.downstream(self.rangeindex.formulas)
+        else:
+            order = self.graph.downstream(self.changed | self.graph.volatile)
+        formulas = []
+        for xy in order:
+            cell = self.cells.get(xy)
+            if hasattr(cell, 'reset'):
+                cell.reset()
+                formulas.append(cell)
+        self.cycles = []
+        t = time.perf_counter()
+        shipped = 0
+        if pool is not None and len(formulas) >= self.PARALLEL:
+            before = len(order)
+            order = self.evaluate_parallel(order, pool, tasks)
+            shipped = before - len(order)
+            formulas = [self.cells[xy] for xy in order
+                        if hasattr(self.cells.get(xy), 'reset')]
+        parallel = time.perf_counter() - t
+        # Compile first, so compiling and evaluating can be timed separately
+        misses = compile_formula.cache_info().misses
+        t0 = time.perf_counter()
+        for cell in formulas:
+            if hasattr(cell, 'compile'):
+                cell.compile()
+        t1 = time.perf_counter()
+        self.evaluate(order)
+        t2 = time.perf_counter()
+        self.timings = dict(
+            formulas = len(formulas) + shipped,
+            compiled = compile_formula.cache_info().misses - misses,
+            compile = t1 - t0,
+            evaluate = t2 - t1,
+            shipped = shipped,
+            parallel = parallel,
+        )
+        self.changed = set()
+
+    def referenced(self, xy):
+        "Return the non-empty cells the formula at xy refers to."
+        found = []
+        for x1, y1, x2, y2 in self.graph.precedents.get(xy, ()):
+            if x1 == x2 and y1 == y2:
+                if (x1, y1) in self.cells:
+                    found.append((x1, y1))
+            else:
+                found.extend(self.cells.select(x1, y1, x2, y2))
+        return found
+
+    def components(self, order):
+        """Split the formulas at the coordinates in order into groups.
 
-    def display(self):
+        The formulas of one group don't refer to those of any other group,
+        directly or indirectly.  Returns a list of lists of coordinates.
+        """
+        parent = {xy: xy for xy in order
+                  if hasattr(self.cells.get(xy), 'reset')}
+        def find(xy):
+            while parent[xy] != xy:
+                parent[xy] = xy = parent[parent[xy]]
+            return xy
+        for xy in parent:
+            for p in self.referenced(xy):
+                if p in parent:
+                    a, b = find(xy), find(p)
+                    if a != b:
+                        parent[a] = b
+        groups = {}
+        for xy in parent:
+            groups.setdefault(find(xy), []).append(xy)
+        return list(groups.values())
+
+    def evaluate_parallel(self, order, pool, tasks=None):
+        """Evaluate independent groups of formulas on a process pool.
+
+        Each batch of groups is shipped as the formula texts plus the values
+        of the other cells they refer to, and comes back as a list of values.
+        Groups with volatile formulas, which may refer to anything, and
+        groups referring to cells that can't be shipped, stay here.  Returns
+        the coordinates of the formulas left to evaluate, in order.
+        """
+        if tasks is None:
+            tasks = 4 * (os.cpu_count() or 1)
+        local = set()
+        payloads = []
+        for group in self.components(order):
+            constants = {}
+            members = set(group)
+            for xy in group:
+                if xy in self.graph.volatile:
+                    break
+                for p in self.referenced(xy):
+                    if p in members or p in constants:
+                        continue
+                    value = self.cellvalue(*p)
+                    if not isinstance(value, (int, float, complex, str)):
+                        break
+                    constants[p] = value
+                else:
+                    continue
+                break
+            else:
+                formulas = [(xy, self.cells[xy]) for xy in group]
+                payloads.append((len(group), constants, formulas))
+                continue
+            local.update(group)
+        # Deal the groups out to the batches, largest first, each to the
+        # smallest batch so far
+        batches = [[0, {}, []] for i in range(min(tasks, len(payloads)))]
+        payloads.sort(key=lambda payload: -payload[0])
+        for size, constants, formulas in payloads:
+            batch = min(batches, key=lambda batch: batch[0])
+            batch[0] += size
+            batch[1].update(constants)
+            batch[2].extend(formulas)
+        results = pool.map(evaluate_block,
+                           [batch[1] for batch in batches],
+                           [batch[2] for batch in batches])
+        for values, cycles in results:
+            for xy, value in values:
+                cell = self.cells[xy]
+                cell.value = value
+                cell.valid = True
+            self.cycles.extend(cycles)
+        return [xy for xy in order if xy in local or
+                not hasattr(self.cells.get(xy), 'reset')]
+
+    def formatcell(self, x, y):
+        """Return (text, alignment) for the cell at (x, y), or None if empty.
+
+        Formulas are evaluated first if they need to be.  The cells cache
+        their text until their value changes.
+        """
+        cell = self.cells.data.get((x, y))
+        if cell is None:
+            return None
+        if hasattr(cell, 'recalc'):
+            self.cellvalue(x, y)
+        if hasattr(cell, 'format'):
+            return cell.format()
+        if isinstance(cell, str):
+            return cell, LEFT
+        return str(cell), RIGHT
+
+    def display(self, x1=1, y1=1, x2=None, y2=None):
+        """Print the cells from (x1, y1) to (x2, y2).
+
+        By default the whole sheet is printed.  Only the cells inside the
+        rectangle are formatted, so a small view of a big sheet is cheap.
+        """
         maxx, maxy = self.getsize()
-        width, height = maxx+1, maxy+1
-        colwidth = [1] * width
-        full = {}
+        if x2 is None:
+            x2 = maxx
+        if y2 is None:
+            y2 = maxy
+        xs = range(x1, x2+1)
+        ys = range(y1, y2+1)
+        colwidth = {0: 1}
+        shown = {}
         # Add column heading labels in row 0
-        for x in range(1, width):
-            full[x, 0] = text, alignment = colnum2name(x), RIGHT
-            colwidth[x] = max(colwidth[x], len(text))
+        for x in xs:
+            shown[x, 0] = text, alignment = colnum2name(x), RIGHT
+            colwidth[x] = max(1, len(text))
         # Add row labels in column 0
-        for y in range(1, height):
-            full[0, y] = text, alignment = str(y), RIGHT
+        for y in ys:
+            shown[0, y] = text, alignment = str(y), RIGHT
             colwidth[0] = max(colwidth[0], len(text))
-        # Add sheet cells in columns with x>0 and y>0
-        for (x, y), cell in self.cells.items():
-            if x <= 0 or y <= 0:
-                continue
-            if hasattr(cell, 'recalc'):
-                cell.recalc(self.ns)
-            if hasattr(cell, 'format'):
-                text, alignment = cell.format()
+        # Add the sheet cells inside the rectangle
+        if xs and ys:
+            for x, y in self.cells.select(x1, y1, x2, y2):
+                text, alignment = self.formatcell(x, y)
                 assert isinstance(text, str)
                 assert alignment in (LEFT, CENTER, RIGHT)
-            else:
-                text = str(cell)
-                if isinstance(cell, str):
-                    alignment = LEFT
-                else:
-                    alignment = RIGHT
-            full[x, y] = (text, alignment)
-            colwidth[x] = max(colwidth[x], len(text))
+                shown[x, y] = (text, alignment)
+                colwidth[x] = max(colwidth[x], len(text))
+        columns = [0] + list(xs)
         # Calculate the horizontal separator line (dashes and dots)
-        sep = ""
-        for x in range(width):
-            if sep:
-                sep += "+"
-            sep += "-"*colwidth[x]
-        # Now print The full grid
-        for y in range(height):
-            line = ""
-            for x in range(width):
-                text, alignment = full.get((x, y)) or ("", LEFT)
-                text = align2action[alignment](text, colwidth[x])
-                if line:
-                    line += '|'
-                line += text
-            print(line)
+        sep = "+".join(["-"*colwidth[x] for x in columns])
+        # Now print the grid
+        for y in [0] + list(ys):
+            line = []
+            for x in columns:
+                text, alignment = shown.get((x, y)) or ("", LEFT)
+                line.append(align2action[alignment](text, colwidth[x]))
+            print('|'.join(line))
             if y == 0:
                 print(sep)
 
     def xml(self):
-        out = ['<spreadsheet>']
+        f = io.StringIO()
+        self.writexml(f)
+        return f.getvalue()
+
+    def writexml(self, f):
+        "Write the sheet as XML to a text file, a batch of cells at a time."
+        f.write('<spreadsheet>')
+        out = []
         for (x, y), cell in self.cells.items():
             if hasattr(cell, 'xml'):
                 cellxml = cell.xml()
             else:
                 cellxml = '<value>%s</value>' % escape(cell)
-            out.append('<cell row="%s" col="%s">\n  %s\n</cell>' %
+            out.append('\n<cell row="%s" col="%s">\n  %s\n</cell>' %
                        (y, x, cellxml))
-        out.append('</spreadsheet>')
-        return '\n'.join(out)
+            if len(out) >= CHUNK:
+                f.write(''.join(out))
+                out = []
+        out.append('\n</spreadsheet>')
+        f.write(''.join(out))
 
     def save(self, filename):
-        text = self.xml()
+        """Save the sheet to a file.
+
+        Files named *.ss1b are written in the binary format (see
+        writebinary()), files named *.csv as CSV holding only the values
+        (see writecsv()), and others as XML.
+        """
+        if filename.endswith(BINARY_SUFFIX):
+            with open(filename, "wb") as f:
+                self.writebinary(f)
+            return
+        if filename.endswith(CSV_SUFFIX):
+            with open(filename, "w", encoding='utf-8', newline='') as f:
+                self.writecsv(f)
+            return
         with open(filename, "w", encoding='utf-8') as f:
-            f.write(text)
-            if text and not text.endswith('\n'):
-                f.write('\n')
+            self.writexml(f)
+            f.write('\n')
 
     def load(self, filename):
-        with open(filename, 'rb') as f:
-            SheetParser(self).parsefile(f)
+        "Load cells from a file in any of the formats save() writes."
+        if filename.endswith(CSV_SUFFIX):
+            with open(filename, encoding='utf-8', newline='') as f:
+                self.readcsv(f)
+            return
+        with open(filename, 'rb') as f, gcpaused():
+            if f.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+                self.readbinary(f)
+            else:
+                f.seek(0)
+                SheetParser(self).parsefile(f)
+
+    def writebinary(self, f):
+        """Write the sheet to a binary file in a compact columnar format.
+
+        After BINARY_MAGIC the file holds marshaled chunks of up to CHUNK
+        cells each: arrays of the x and y coordinates, a byte string giving
+        the kind of each cell (see BINARY_KINDS), the list of values
+        (numbers, strings or formula texts), and a dictionary mapping the
+        index of each cell without the default format and alignment to its
+        (format, alignment).
+        """
+        f.write(BINARY_MAGIC)
+        items = iter(self.cells.items())
+        while True:
+            xs = array.array('i')
+            ys = array.array('i')
+            kinds = bytearray()
+            values = []
+            styles = {}
+            for (x, y), cell in items:
+                if isinstance(cell, FormulaCell):
+                    kind = b'='
+                    values.append(cell.formula)
+                elif isinstance(cell, StringCell):
+                    kind = b's'
+                    values.append(cell.text)
+                elif isinstance(cell, NumericCell):
+                    kind = BINARY_TYPES[type(cell.value)]
+                    values.append(cell.value)
+                else:
+                    raise TypeError("can't save %r in binary" % (cell,))
+                if (cell.fmt, cell.alignment) != BINARY_DEFAULTS[kind]:
+                    styles[len(kinds)] = cell.fmt, cell.alignment
+                kinds += kind
+                xs.append(x)
+                ys.append(y)
+                if len(kinds) >= CHUNK:
+                    break
+            if not kinds:
+                break
+            if sys.byteorder != 'little':
+                xs.byteswap()
+                ys.byteswap()
+            marshal.dump((xs.tobytes(), ys.tobytes(), bytes(kinds), values,
+                          styles), f)
+
+    def readbinary(self, f):
+        "Read cells written by writebinary(), after the magic string."
+        while True:
+            try:
+                chunk = marshal.load(f)
+            except EOFError:
+                break
+            xs, ys, kinds, values, styles = chunk
+            xs = array.array('i', xs)
+            ys = array.array('i', ys)
+            if sys.byteorder != 'little':
+                xs.byteswap()
+                ys.byteswap()
+            items = []
+            for i, kind in enumerate(kinds):
+                kind = BINARY_KINDS[kind]
+                fmt, alignment = styles.get(i) or BINARY_DEFAULTS[kind]
+                if kind == b'=':
+                    cell = FormulaCell(values[i], fmt, alignment)
+                elif kind == b's':
+                    cell = StringCell(values[i], fmt, alignment)
+                else:
+                    cell = NumericCell(values[i], fmt, alignment)
+                items.append(((xs[i], ys[i]), cell))
+            self.setcells(items)
+
+    def readcsv(self, f, x0=1, y0=1, dialect='excel'):
+        """Read rows of values from a CSV file, the first at (x0, y0).
+
+        The rows are streamed, and the cells inserted CHUNK at a time.  The
+        type of each column is inferred once, from the first chunk of rows
+        less the first row, which may be a heading: int if all its values
+        are integers, float if they are all numbers, and str otherwise.
+        Values of numeric columns are converted to that type where possible,
+        and values of string columns are never parsed.  Empty fields make no
+        cell, and text starting with "=" is kept as a string, not taken as a
+        formula.  Returns the number of rows read.
+        """
+        with gcpaused():
+            new = object.__new__
+            reader = csv.reader(f, dialect)
+            parsers = []
+            y = y0
+            while True:
+                rows = []
+                for row in reader:
+                    rows.append(row)
+                    if len(rows) >= CHUNK:
+                        break
+                if not rows:
+                    break
+                sample = rows[1:] if y == y0 and len(rows) > 1 else rows
+                for x in range(len(parsers), max(map(len, rows))):
+                    parsers.append(csvcolumntype([row[x] for row in sample
+                                                  if x < len(row)]))
+                items = []
+                for row in rows:
+                    for x, text in enumerate(row):
+                        if not text:
+                            continue
+                        parse = parsers[x]
+                        if parse is not str:
+                            try:
+                                value = parse(text)
+                            except ValueError:
+                                value = csvnumber(text)
+                            if value is not None:
+                                # Skip the constructor's checks, which
+                                # parsed values pass anyway
+                                cell = new(NumericCell)
+                                cell.value = value
+                                cell.fmt = "%s"
+                                cell.alignment = RIGHT
+                                items.append(((x0 + x, y), cell))
+                                continue
+                        cell = new(StringCell)
+                        cell.text = text
+                        cell.fmt = "%s"
+                        cell.alignment = LEFT
+                        items.append(((x0 + x, y), cell))
+                    y += 1
+                self.setcells(items)
+        return y - y0
+
+    def writecsv(self, f, dialect='excel'):
+        """Write the computed values of the sheet to a CSV file.
+
+        Every row from 1 to the last one in use is written, with a field
+        for every column from 1 to the last one in use; empty cells give
+        empty fields.  Rows are written CHUNK at a time.
+        """
+        self.recalc()
+        ns = self.ns
+        writer = csv.writer(f, dialect)
+        maxx, maxy = self.getsize()
+        rows = self.cells.rows
+        data = self.cells.data
+        out = []
+        for y in range(1, maxy+1):
+            line = [''] * maxx
+            for x in rows.get(y, ()):
+                if x > 0:
+                    line[x-1] = data[x, y].recalc(ns)
+            out.append(line)
+            if len(out) >= CHUNK:
+                writer.writerows(out)
+                out = []
+        writer.writerows(out)
+
+class SparseGrid:
+
+    """A dictionary keyed by (x, y), indexed by column and by row.
+
+    Each column keeps the sorted list of its rows in use, and each row the
+    sorted list of its columns, so select() costs time proportional to the
+    rows or columns spanned (whichever are fewer) plus the keys found, and
+    extent() is constant time.
+    """
+
+    def __init__(self, items=()):
+        self.data = {}
+        self.columns = {} # {x: [y, ...] sorted, ...}
+        self.rows = {} # {y: [x, ...] sorted, ...}
+        self.xs = [] # sorted x of non-empty columns
+        self.ys = [] # sorted y of non-empty rows
+        for xy, value in items:
+            self[xy] = value
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __contains__(self, xy):
+        return xy in self.data
+
+    def __getitem__(self, xy):
+        return self.data[xy]
+
+    def __setitem__(self, xy, value):
+        if xy not in self.data:
+            x, y = xy
+            self.link(self.columns, self.xs, x, y)
+            self.link(self.rows, self.ys, y, x)
+        self.data[xy] = value
+
+    def __delitem__(self, xy):
+        del self.data[xy]
+        x, y = xy
+        self.unlink(self.columns, self.xs, x, y)
+        self.unlink(self.rows, self.ys, y, x)
+
+    def link(self, index, keys, major, minor):
+        line = index.get(major)
+        if line is None:
+            index[major] = [minor]
+            bisect.insort(keys, major)
+        elif line[-1] < minor:
+            line.append(minor)
+        else:
+            bisect.insort(line, minor)
+
+    def unlink(self, index, keys, major, minor):
+        line = index[major]
+        del line[bisect.bisect_left(line, minor)]
+        if not line:
+            del index[major]
+            del keys[bisect.bisect_left(keys, major)]
+
+    def update(self, items):
+        "Set many keys at once; cheaper than one by one for large batches."
+        new = []
+        data = self.data
+        for xy, value in items:
+            if xy not in data:
+                new.append(xy)
+            data[xy] = value
+        self.linkmany(self.columns, self.xs, new)
+        self.linkmany(self.rows, self.ys, [(y, x) for x, y in new])
+
+    def popmany(self, keys):
+        "Remove many keys at once, returning their values."
+        values = [self.data.pop(xy) for xy in keys]
+        self.unlinkmany(self.columns, self.xs, keys)
+        self.unlinkmany(self.rows, self.ys, [(y, x) for x, y in keys])
+        return values
+
+    # Lines getting fewer new entries than this are updated in place;
+    # others are rebuilt in one pass.
+    BATCH = 16
+
+    def linkmany(self, index, keys, pairs):
+        groups = {}
+        for major, minor in pairs:
+            groups.setdefault(major, []).append(minor)
+        added = []
+        for major, minors in groups.items():
+            line = index.get(major)
+            minors.sort()
+            if line is None:
+                index[major] = minors
+                added.append(major)
+            elif minors[0] > line[-1]:
+                # Appending, as when a sheet is loaded in order
+                line.extend(minors)
+            elif len(minors) < self.BATCH:
+                for minor in minors:
+                    bisect.insort(line, minor)
+            else:
+                line.extend(minors)
+                line.sort()
+        added.sort()
+        if not added:
+            pass
+        elif not keys or added[0] > keys[-1]:
+            keys.extend(added)
+        elif len(added) < self.BATCH:
+            for major in added:
+                bisect.insort(keys, major)
+        else:
+            keys.extend(added)
+            keys.sort()
+
+    def unlinkmany(self, index, keys, pairs):
+        groups = {}
+        for major, minor in pairs:
+            groups.setdefault(major, []).append(minor)
+        emptied = []
+        for major, minors in groups.items():
+            line = index[major]
+            if len(minors) == len(line):
+                del index[major]
+                emptied.append(major)
+            elif len(minors) < self.BATCH:
+                for minor in minors:
+                    del line[bisect.bisect_left(line, minor)]
+            else:
+                gone = set(minors)
+                line[:] = [minor for minor in line if minor not in gone]
+        if len(emptied) < self.BATCH:
+            for major in emptied:
+                del keys[bisect.bisect_left(keys, major)]
+        else:
+            gone = set(emptied)
+            keys[:] = [major for major in keys if major not in gone]
+
+    def get(self, xy, default=None):
+        return self.data.get(xy, default)
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
+
+    def extent(self):
+        "Return the largest x and y in use, or (0, 0) if empty."
+        return (self.xs[-1] if self.xs else 0,
+                self.ys[-1] if self.ys else 0)
+
+    def select(self, x1, y1, x2, y2):
+        "Return the keys inside a rectangle, sorted."
+        if x1 > x2:
+            x1, x2 = x2, x1
+        if y1 > y2:
+            y1, y2 = y2, y1
+        xs = self.xs
+        i, j = bisect.bisect_left(xs, x1), bisect.bisect_right(xs, x2)
+        ys = self.ys
+        k, l = bisect.bisect_left(ys, y1), bisect.bisect_right(ys, y2)
+        found = []
+        if j-i <= l-k:
+            for x in xs[i:j]:
+                column = self.columns[x]
+                lo = bisect.bisect_left(column, y1)
+                hi = bisect.bisect_right(column, y2)
+                found.extend([(x, y) for y in column[lo:hi]])
+        else:
+            for y in ys[k:l]:
+                row = self.rows[y]
+                lo = bisect.bisect_left(row, x1)
+                hi = bisect.bisect_right(row, x2)
+                found.extend([(x, y) for x in row[lo:hi]])
+            found.sort()
+        return found
+
+class DependencyGraph:
+
+    """Which formula cells refer to which cells.
+
+    The references of a formula are given as (x1, y1, x2, y2) rectangles, as
+    returned by references().  Single cells are indexed by coordinate, and
+    ranges by each column they span.  The corners of every reference are
+    also kept in a SparseGrid, so referring() can find the formulas that
+    need renumbering when cells move.  Volatile formulas, whose references
+    can't be known before they run, are recomputed on every recalc.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.dependents = {} # {(x, y): {formula (x, y), ...}, ...}
+        self.ranges = {} # {x: {(y1, y2, formula (x, y)), ...}, ...}
+        self.precedents = {} # {formula (x, y): refs, ...}
+        self.corners = SparseGrid() # {(x, y): {formula (x, y), ...}, ...}
+        self.volatile = set()
+
+    def add(self, xy, refs, volatile=False):
+        self.precedents[xy] = refs
+        for x1, y1, x2, y2 in refs:
+            if x1 == x2 and y1 == y2:
+                self.dependents.setdefault((x1, y1), set()).add(xy)
+            else:
+                for x in range(x1, x2+1):
+                    self.ranges.setdefault(x, set()).add((y1, y2, xy))
+            for corner in {(x1, y1), (x2, y1), (x1, y2), (x2, y2)}:
+                formulas = self.corners.get(corner)
+                if formulas is None:
+                    self.corners[corner] = formulas = set()
+                formulas.add(xy)
+        if volatile:
+            self.volatile.add(xy)
+
+    def remove(self, xy):
+        refs = self.precedents.pop(xy, None)
+        if refs is None:
+            return
+        for x1, y1, x2, y2 in refs:
+            if x1 == x2 and y1 == y2:
+                deps = self.dependents.get((x1, y1))
+                if deps is not None:
+                    deps.discard(xy)
+                    if not deps:
+                        del self.dependents[x1, y1]
+            else:
+                for x in range(x1, x2+1):
+                    self.ranges[x].discard((y1, y2, xy))
+            for corner in {(x1, y1), (x2, y1), (x1, y2), (x2, y2)}:
+                formulas = self.corners.get(corner)
+                if formulas is not None:
+                    formulas.discard(xy)
+                    if not formulas:
+                        del self.corners[corner]
+        self.volatile.discard(xy)
+
+    def referring(self, x1, y1, x2, y2):
+        "Return the formulas with a reference ending inside a rectangle."
+        found = set()
+        for corner in self.corners.select(x1, y1, x2, y2):
+            found.update(self.corners[corner])
+        return sorted(found)
+
+    def dependents_of(self, xy):
+        "Return the formula cells referring directly to cell xy."
+        deps = self.dependents.get(xy, ())
+        column = self.ranges.get(xy[0])
+        if column:
+            y = xy[1]
+            deps = list(deps)
+            deps.extend([f for y1, y2, f in column if y1 <= y <= y2])
+        return deps
+
+    def downstream(self, roots):
+        """Return the roots and every cell depending on them.
+
+        The cells are in topological order: each comes after all the cells
+        it depends on (unless they form a cycle).
+        """
+        order = []
+        seen = set()
+        for root in roots:
+            if root in seen:
+                continue
+            seen.add(root)
+            stack = [(root, iter(self.dependents_of(root)))]
+            while stack:
+                xy, deps = stack[-1]
+                for dep in deps:
+                    if dep not in seen:
+                        seen.add(dep)
+                        stack.append((dep, iter(self.dependents_of(dep))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(xy)
+        order.reverse()
+        return order
+
+def evaluate_block(constants, formulas):
+    """Evaluate formulas on a scratch sheet; run by Sheet.evaluate_parallel().
+
+    constants maps coordinates to the values of the cells the formulas refer
+    to, and formulas is a list of (coordinates, FormulaCell) pairs.  Returns
+    the list of (coordinates, value) pairs and the list of reference cycles.
+    Cell ranges are returned as lists.
+    """
+    sheet = Sheet()
+    for (x, y), value in constants.items():
+        if isinstance(value, str):
+            sheet.setcell(x, y, StringCell(value))
+        else:
+            sheet.setcell(x, y, NumericCell(value))
+    for (x, y), cell in formulas:
+        sheet.setcell(x, y, cell)
+    sheet.recalc()
+    values = []
+    for xy, cell in formulas:
+        value = sheet.cells[xy].value
+        if isinstance(value, CellRange):
+            value = value.tolist()
+        values.append((xy, value))
+    return values, sheet.cycles
+
+class NeedValue(Exception):
+    "Raised by Sheet.cellvalue() for a formula not evaluated yet."
+
+class CycleError(Exception):
+    "A formula refers to itself, directly or through other formulas."
+
+class CellRange:
+
+    """The values of a rectangle of cells, as returned by cells().
+
+    It acts as the list of values, row by row with None for empty cells,
+    that cells() used to return, but the list is only made when it is
+    needed.  The sum(), count(), average(), min() and max() of a range are
+    computed by the sheet's RangeIndex instead, and array() returns the
+    values as a float array for bulk numeric work.
+    """
+
+    def __init__(self, sheet, x1, y1, x2, y2):
+        if x1 > x2:
+            x1, x2 = x2, x1
+        if y1 > y2:
+            y1, y2 = y2, y1
+        self.sheet = sheet
+        self.bounds = x1, y1, x2, y2
+        self.values = None
+
+    def tolist(self):
+        if self.values is None:
+            x1, y1, x2, y2 = self.bounds
+            cellvalue = self.sheet.cellvalue
+            self.values = [cellvalue(x, y)
+                           for y in range(y1, y2+1)
+                           for x in range(x1, x2+1)]
+        return self.values
+
+    def __len__(self):
+        x1, y1, x2, y2 = self.bounds
+        return (x2-x1+1) * (y2-y1+1)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, i):
+        return self.tolist()[i]
+
+    def __eq__(self, other):
+        if isinstance(other, CellRange):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def __add__(self, other):
+        return self.tolist() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.tolist()
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def array(self):
+        "Return the values as floats, with NaN for empty cells."
+        values = [math.nan if x is None else x for x in self.tolist()]
+        if numpy is not None:
+            return numpy.array(values, dtype=float)
+        return array.array('d', values)
+
+    def aggregate(self):
+        return self.sheet.rangeindex.aggregate(self.sheet, *self.bounds)
+
+    def sum(self):
+        agg = self.aggregate()
+        if agg is None:
+            return sum(self.tolist())
+        return agg[0]
+
+    def count(self):
+        agg = self.aggregate()
+        if agg is None:
+            return count(self.tolist())
+        return agg[1]
+
+    def average(self):
+        agg = self.aggregate()
+        if agg is None:
+            return average(self.tolist())
+        return agg[0] / agg[1]
+
+    def min(self):
+        agg = self.aggregate()
+        if agg is None:
+            return min([x for x in self.tolist() if x is not None])
+        if not agg[1]:
+            raise ValueError("min() of an empty range")
+        return agg[2]
+
+    def max(self):
+        agg = self.aggregate()
+        if agg is None:
+            return max([x for x in self.tolist() if x is not None])
+        if not agg[1]:
+            raise ValueError("max() of an empty range")
+        return agg[3]
+
+class RangeIndex:
+
+    """Aggregates over rectangles of cells, for cells() ranges.
+
+    The constant numbers of each column are kept in a ColumnTree, built the
+    first time a range covers the column and updated on every edit after
+    that, so the sum, count, minimum and maximum of a range cost O(log n)
+    per column.  Formula cells inside a range are evaluated one by one.
+    Strings and complex numbers aren't aggregated; aggregate() returns None
+    for ranges holding them, and the caller looks at every value instead.
+    """
+
+    def __init__(self):
+        self.numbers = {} # {x: {y: number, ...}, ...}
+        self.trees = {} # {x: ColumnTree, ...}
+        self.xs = [] # sorted x of the columns in self.numbers
+        self.formulas = SparseGrid() # {(x, y): True, ...}
+        self.others = SparseGrid() # {(x, y): True, ...}
+
+    def set(self, x, y, cell):
+        "Note the cell now at (x, y), or None if it was cleared."
+        xy = x, y
+        column = self.numbers.get(x)
+        if column is not None and y in column:
+            del column[y]
+            if not column:
+                del self.numbers[x]
+                self.trees.pop(x, None)
+                del self.xs[bisect.bisect_left(self.xs, x)]
+            elif x in self.trees:
+                self.trees[x].set(y, None)
+        elif xy in self.formulas:
+            del self.formulas[xy]
+        elif xy in self.others:
+            del self.others[xy]
+        if cell is None:
+            pass
+        elif hasattr(cell, 'reset'):
+            self.formulas[xy] = True
+        elif (isinstance(cell, NumericCell) and
+              isinstance(cell.value, (int, float))):
+            column = self.numbers.get(x)
+            if column is None:
+                self.numbers[x] = column = {}
+                bisect.insort(self.xs, x)
+            column[y] = cell.value
+            if x in self.trees:
+                self.trees[x].set(y, cell.value)
+        else:
+            self.others[xy] = True
+
+    def setmany(self, items):
+        "Like set() for many ((x, y), cell) pairs, but cheaper in bulk."
+        numbers = self.numbers
+        trees = self.trees
+        formulas = []
+        others = []
+        for (x, y), cell in items:
+            column = numbers.get(x)
+            if ((column is not None and y in column) or
+                (x, y) in self.formulas.data or (x, y) in self.others.data):
+                self.set(x, y, cell)
+            elif hasattr(cell, 'reset'):
+                formulas.append(((x, y), True))
+            elif (isinstance(cell, NumericCell) and
+                  isinstance(cell.value, (int, float))):
+                if column is None:
+                    numbers[x] = column = {}
+                    bisect.insort(self.xs, x)
+                column[y] = cell.value
+                if x in trees:
+                    trees[x].set(y, cell.value)
+            else:
+                others.append(((x, y), True))
+        self.formulas.update(formulas)
+        self.others.update(others)
+
+    def aggregate(self, sheet, x1, y1, x2, y2):
+        """Return (sum, count, min, max) of the numbers in a rectangle.
+
+        The min and max are None if there are no numbers.  Returns None if
+        the rectangle holds anything but numbers and empty cells.
+        """
+        if self.others.select(x1, y1, x2, y2):
+            return None
+        total = 0
+        n = 0
+        lo = hi = None
+        xs = self.xs
+        for x in xs[bisect.bisect_left(xs, x1):bisect.bisect_right(xs, x2)]:
+            tree = self.trees.get(x)
+            if tree is None:
+                self.trees[x] = tree = ColumnTree(self.numbers[x])
+            s, c, a, b = tree.query(y1, y2)
+            if c:
+                total += s
+                n += c
+                if lo is None or a < lo:
+                    lo = a
+                if hi is None or b > hi:
+                    hi = b
+        for x, y in self.formulas.select(x1, y1, x2, y2):
+            value = sheet.cellvalue(x, y)
+            if value is None:
+                continue
+            if not isinstance(value, (int, float)):
+                return None
+            total += value
+            n += 1
+            if lo is None or value < lo:
+                lo = value
+            if hi is None or value > hi:
+                hi = value
+        return total, n, lo, hi
+
+class ColumnTree:
+
+    """A segment tree over the numbers in one column, indexed by row.
+
+    Every node holds the sum, count, minimum and maximum of the leaves below
+    it.  An update recomputes the nodes above the leaf rather than adding a
+    difference, so float sums don't drift as cells are edited.
+    """
+
+    def __init__(self, numbers):
+        self.numbers = numbers # {y: number, ...}, shared with RangeIndex
+        self.build()
+
+    def build(self):
+        size = 1
+        top = max(self.numbers, default=0)
+        while size <= top:
+            size *= 2
+        self.size = size
+        self.sums = [0] * (2*size)
+        self.counts = [0] * (2*size)
+        self.mins = [None] * (2*size)
+        self.maxs = [None] * (2*size)
+        for y, value in self.numbers.items():
+            i = size + y
+            self.sums[i] = self.mins[i] = self.maxs[i] = value
+            self.counts[i] = 1
+        for i in range(size-1, 0, -1):
+            self.pull(i)
+
+    def pull(self, i):
+        l = 2*i
+        r = l+1
+        self.sums[i] = self.sums[l] + self.sums[r]
+        self.counts[i] = self.counts[l] + self.counts[r]
+        a, b = self.mins[l], self.mins[r]
+        self.mins[i] = b if a is None else a if b is None or a <= b else b
+        a, b = self.maxs[l], self.maxs[r]
+        self.maxs[i] = b if a is None else a if b is None or a >= b else b
+
+    def set(self, y, value):
+        "Update row y, after it was changed in the numbers dictionary."
+        if y >= self.size:
+            if value is not None:
+                self.build()
+            return
+        i = self.size + y
+        if value is None:
+            self.sums[i] = 0
+            self.counts[i] = 0
+            self.mins[i] = self.maxs[i] = None
+        else:
+            self.sums[i] = self.mins[i] = self.maxs[i] = value
+            self.counts[i] = 1
+        i //= 2
+        while i:
+            self.pull(i)
+            i //= 2
+
+    def query(self, y1, y2):
+        "Return (sum, count, min, max) of rows y1 through y2."
+        size = self.size
+        y1 = max(y1, 0)
+        y2 = min(y2, size-1)
+        total = 0
+        n = 0
+        lo = hi = None
+        if y1 > y2:
+            return total, n, lo, hi
+        nodes = []
+        l = y1 + size
+        r = y2 + size + 1
+        while l < r:
+            if l & 1:
+                nodes.append(l)
+                l += 1
+            if r & 1:
+                r -= 1
+                nodes.append(r)
+            l //= 2
+            r //= 2
+        for i in nodes:
+            if self.counts[i]:
+                total += self.sums[i]
+                n += self.counts[i]
+                a, b = self.mins[i], self.maxs[i]
+                if lo is None or a < lo:
+                    lo = a
+                if hi is None or b > hi:
+                    hi = b
+        return total, n, lo, hi
 
 class SheetParser:
 
+    """Load XML into a sheet.
+
+    The file is parsed incrementally, and the cells are added to the sheet
+    CHUNK at a time, so memory use doesn't grow with the size of the file
+    beyond what the cells themselves take.
+    """
+
     def __init__(self, sheet):
         self.sheet = sheet
+        self.pending = []
 
     def parsefile(self, f):
         parser = expat.ParserCreate()
+        parser.buffer_text = True
         parser.StartElementHandler = self.startelement
         parser.EndElementHandler = self.endelement
         parser.CharacterDataHandler = self.data
-        parser.ParseFile(f)
+        while True:
+            data = f.read(65536)
+            if not data:
+                break
+            parser.Parse(data, False)
+        parser.Parse(b'', True)
+        self.flush()
+
+    def flush(self):
+        self.sheet.setcells(self.pending)
+        self.pending = []
 
     def startelement(self, tag, attrs):
         method = getattr(self, 'start_'+tag, None)
@@ -299,7 +1533,10 @@ class SheetParser:
                                 self.alignment or RIGHT)
 
     def end_cell(self, text):
-        self.sheet.setcell(self.x, self.y, self.cell)
+        assert self.x > 0 and self.y > 0
+        self.pending.append(((self.x, self.y), self.cell))
+        if len(self.pending) >= CHUNK:
+            self.flush()
 
 class BaseCell:
     __init__ = None # Must provide
@@ -311,7 +1548,12 @@ class BaseCell:
     cell.recalc(ns) -> value -- recalculate formula
     cell.format() -> (value, alignment) -- return formatted value
     cell.xml() -> string -- return XML
+
+    cell.valid is false from reset() until recalc() is done, and
+    cell.formatted caches the result of format() until the value changes.
     """
+    valid = True
+    formatted = None
 
 class NumericCell(BaseCell):
 
@@ -326,11 +1568,13 @@ class NumericCell(BaseCell):
         return self.value
 
     def format(self):
-        try:
-            text = self.fmt % self.value
-        except:
-            text = str(self.value)
-        return text, self.alignment
+        if self.formatted is None:
+            try:
+                text = self.fmt % self.value
+            except:
+                text = str(self.value)
+            self.formatted = text, self.alignment
+        return self.formatted
 
     def xml(self):
         method = getattr(self, '_xml_' + type(self.value).__name__)
@@ -379,31 +1623,70 @@ class FormulaCell(BaseCell):
         assert alignment in (LEFT, CENTER, RIGHT)
         self.formula = formula
         self.translated = translate(self.formula)
+        self.refs = references(self.formula)
+        self.code = None
+        # Formulas calling cell() or cells() themselves may refer to anything
+        self.volatile = re.search(r"\bcells?\s*\(", self.formula) is not None
         self.fmt = fmt
         self.alignment = alignment
         self.reset()
 
     def reset(self):
         self.value = None
+        self.valid = False
+        self.formatted = None
+
+    def __getstate__(self):
+        # Code objects can't be pickled; the copy compiles its own
+        state = self.__dict__.copy()
+        state.update(code=None, value=None, valid=False, formatted=None)
+        return state
+
+    def fail(self, exc):
+        "Give the cell the value of a formula raising exc."
+        self.value = exc.__name__
+        self.valid = True
+        self.formatted = None
+
+    def compile(self):
+        """Compile the translated formula, if that wasn't done yet.
+
+        Cells with the same translated formula share one code object.  Edits
+        and renumber() make new cells, so the code never goes stale.
+        """
+        if self.code is None:
+            try:
+                self.code = compile_formula(self.translated)
+            except SyntaxError:
+                pass # recalc() reports it
 
     def recalc(self, ns):
-        if self.value is None:
+        if not self.valid:
             try:
-                self.value = eval(self.translated, ns)
+                if self.code is None:
+                    self.code = compile_formula(self.translated)
+                self.value = eval(self.code, ns)
+            except NeedValue:
+                raise # Sheet.evaluate() tries again later
             except:
                 exc = sys.exc_info()[0]
                 if hasattr(exc, "__name__"):
                     self.value = exc.__name__
                 else:
                     self.value = str(exc)
+            self.valid = True
         return self.value
 
     def format(self):
-        try:
-            text = self.fmt % self.value
-        except:
-            text = str(self.value)
-        return text, self.alignment
+        if self.formatted is None:
+            try:
+                text = self.fmt % self.value
+            except:
+                text = str(self.value)
+            if not self.valid:
+                return text, self.alignment
+            self.formatted = text, self.alignment
+        return self.formatted
 
     def xml(self):
         return '<formula align="%s" format="%s">%s</formula>' % (
@@ -424,6 +1707,50 @@ class FormulaCell(BaseCell):
             out.append(part)
         return FormulaCell("".join(out), self.fmt, self.alignment)
 
+@contextlib.contextmanager
+def gcpaused():
+    """Suspend the cyclic garbage collector.
+
+    Loading makes millions of cells and no reference cycles, and would
+    otherwise set off many full collections that find nothing to free.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def csvnumber(text):
+    "Return text as an int or a float, or None if it's neither."
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def csvcolumntype(texts):
+    "Return int, float or str, whichever fits all the non-empty texts."
+    column = int
+    for text in texts:
+        if not text:
+            continue
+        if column is int:
+            try:
+                int(text)
+                continue
+            except ValueError:
+                column = float
+        try:
+            float(text)
+        except ValueError:
+            return str
+    return column
+
 def translate(formula):
     """Translate a formula containing fancy cell names to valid Python code.
 
@@ -447,6 +1774,32 @@ def translate(formula):
             out.append(s)
     return "".join(out)
 
+@functools.lru_cache(maxsize=4096)
+def compile_formula(translated):
+    "Compile a translated formula to a code object, caching the result."
+    return compile(translated, '<formula>', 'eval')
+
+def references(formula):
+    """Return the cells a formula refers to, as (x1, y1, x2, y2) tuples.
+
+    Examples:
+        B4 -> (2, 4, 2, 4)
+        Z100:B4 -> (2, 4, 26, 100)
+    """
+    refs = []
+    for m in re.finditer(r"\b([A-Z]+)([1-9][0-9]*)(?::([A-Z]+)([1-9][0-9]*))?\b",
+                         formula):
+        x1, y1, x2, y2 = m.groups()
+        x1 = colname2num(x1)
+        y1 = int(y1)
+        if x2 is None:
+            refs.append((x1, y1, x1, y1))
+        else:
+            x2 = colname2num(x2)
+            y2 = int(y2)
+            refs.append((min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
+    return refs
+
 def cellname(x, y):
     "Translate a cell coordinate to a fancy cell name (e.g. (1, 1)->'A1')."
     assert x > 0 # Column 0 has an empty name, so can't use that
@@ -476,11 +1829,15 @@ class SheetGUI:
 
     """Beginnings of a GUI for a spreadsheet.
 
+    The grid is a viewport onto the sheet: it has a fixed number of GUI
+    cells, which show the rows and columns from self.top and self.left on,
+    and scrolling relabels them.  Each GUI cell remembers the text it
+    shows, so only the cells whose text changed are reconfigured.
+
     TO DO:
     - clear multiple cells
     - Insert, clear, remove rows or columns
     - Show new contents while typing
-    - Scroll bars
     - Grow grid when window is grown
     - Proper menus
     - Undo, redo
@@ -488,6 +1845,10 @@ class SheetGUI:
     - Formatting and alignment
     """
 
+    # The grid grows to show the whole sheet up to this size
+    MAXROWS = 40
+    MAXCOLUMNS = 12
+
     def __init__(self, filename="sheet1.xml", rows=10, columns=5):
         """Constructor.
 
@@ -501,8 +1862,8 @@ class SheetGUI:
             self.sheet.load(filename)
         # Calculate the needed grid size
         maxx, maxy = self.sheet.getsize()
-        rows = max(rows, maxy)
-        columns = max(columns, maxx)
+        rows = max(rows, min(maxy, self.MAXROWS))
+        columns = max(columns, min(maxx, self.MAXCOLUMNS))
         # Create the widgets
         self.root = Tk.Tk()
         self.root.wm_title("Spreadsheet: %s" % self.filename)
@@ -511,9 +1872,17 @@ class SheetGUI:
         self.entry = Tk.Entry(self.root)
         self.savebutton = Tk.Button(self.root, text="Save",
                                     command=self.save)
-        self.cellgrid = Tk.Frame(self.root)
+        self.view = Tk.Frame(self.root)
+        self.cellgrid = Tk.Frame(self.view)
+        self.vbar = Tk.Scrollbar(self.view, orient="vertical",
+                                 command=self.yview)
+        self.hbar = Tk.Scrollbar(self.view, orient="horizontal",
+                                 command=self.xview)
         # Configure the widget lay-out
-        self.cellgrid.pack(side="bottom", expand=1, fill="both")
+        self.view.pack(side="bottom", expand=1, fill="both")
+        self.hbar.pack(side="bottom", fill="x")
+        self.vbar.pack(side="right", fill="y")
+        self.cellgrid.pack(side="left", expand=1, fill="both")
         self.beacon.pack(side="left")
         self.savebutton.pack(side="right")
         self.entry.pack(side="left", expand=1, fill="x")
@@ -524,6 +1893,11 @@ class SheetGUI:
         self.entry.bind("<Shift-Tab>", self.shift_tab_event)
         self.entry.bind("<Delete>", self.delete_event)
         self.entry.bind("<Escape>", self.escape_event)
+        self.entry.bind("<Prior>", self.prior_event)
+        self.entry.bind("<Next>", self.next_event)
+        self.root.bind("<MouseWheel>", self.wheel_event)
+        self.root.bind("<Button-4>", self.wheel_event)
+        self.root.bind("<Button-5>", self.wheel_event)
         # Now create the cell grid
         self.makegrid(rows, columns)
         # Select the top-left cell
@@ -562,9 +1936,12 @@ class SheetGUI:
         """Helper to create the grid of GUI cells.
 
         The edge (x==0 or y==0) is filled with labels; the rest is real cells.
+        self.gridcells maps the sheet coordinates shown to the GUI cells, and
+        self.labels their fixed places in the grid.
         """
         self.rows = rows
         self.columns = columns
+        self.top = self.left = 1
         self.gridcells = {}
         # Create the top left corner cell (which selects all)
         cell = Tk.Label(self.cellgrid, relief='raised')
@@ -607,6 +1984,9 @@ class SheetGUI:
                 cell.bind("<B1-Motion>", self.motion)
                 cell.bind("<ButtonRelease-1>", self.release)
                 cell.bind("<Shift-Button-1>", self.release)
+        for cell in self.gridcells.values():
+            cell.__shown = None
+        self.labels = dict(self.gridcells)
 
     def selectall(self, event):
         self.setcurrent(1, 1)
@@ -668,9 +2048,8 @@ class SheetGUI:
         self.entry.focus_set()
         self.currentxy = x, y
         self.cornerxy = None
-        gridcell = self.gridcells.get(self.currentxy)
-        if gridcell is not None:
-            gridcell['bg'] = 'yellow'
+        self.see(x, y)
+        self.showfocus()
 
     def setcorner(self, x, y):
         if self.currentxy is None or self.currentxy == (x, y):
@@ -684,12 +2063,7 @@ class SheetGUI:
             x1, x2 = x2, x1
         if y1 > y2:
             y1, y2 = y2, y1
-        for (x, y), cell in self.gridcells.items():
-            if x1 <= x <= x2 and y1 <= y <= y2:
-                cell['bg'] = 'lightBlue'
-        gridcell = self.gridcells.get(self.currentxy)
-        if gridcell is not None:
-            gridcell['bg'] = 'yellow'
+        self.showfocus()
         self.setbeacon(x1, y1, x2, y2)
 
     def setbeacon(self, x1, y1, x2, y2):
@@ -712,6 +2086,21 @@ class SheetGUI:
         self.beacon['text'] = name
 
 
+    def showfocus(self):
+        "Highlight the selected cells in view, and the current one."
+        if self.currentxy is not None:
+            x1, y1 = self.currentxy
+            x2, y2 = self.cornerxy or self.currentxy
+            if x1 > x2:
+                x1, x2 = x2, x1
+            if y1 > y2:
+                y1, y2 = y2, y1
+            for (x, y), cell in self.gridcells.items():
+                if (x, y) == self.currentxy:
+                    cell['bg'] = 'yellow'
+                elif x1 <= x <= x2 and y1 <= y <= y2:
+                    cell['bg'] = 'lightBlue'
+
     def clearfocus(self):
         if self.currentxy is not None:
             x1, y1 = self.currentxy
@@ -776,22 +2165,125 @@ class SheetGUI:
             self.sheet.setcell(x, y, cell)
         self.sync()
 
+    def prior_event(self, event):
+        "Callback for the Page Up key."
+        self.change_cell()
+        x, y = self.currentxy
+        self.scrollto(self.left, self.top - self.rows)
+        self.setcurrent(x, max(1, y - self.rows))
+        return "break"
+
+    def next_event(self, event):
+        "Callback for the Page Down key."
+        self.change_cell()
+        x, y = self.currentxy
+        self.scrollto(self.left, self.top + self.rows)
+        self.setcurrent(x, y + self.rows)
+        return "break"
+
+    def wheel_event(self, event):
+        "Callback for the mouse wheel; with Shift it scrolls sideways."
+        if event.num == 5 or event.delta < 0:
+            n = 3
+        else:
+            n = -3
+        if event.state & 1:
+            self.scrollto(self.left + n, self.top)
+        else:
+            self.scrollto(self.left, self.top + n)
+
+    def xview(self, *args):
+        "Callback for the horizontal scroll bar."
+        maxx, maxy = self.sheet.getsize()
+        self.scrollto(scrolled(self.left, self.columns, maxx, args),
+                      self.top)
+
+    def yview(self, *args):
+        "Callback for the vertical scroll bar."
+        maxx, maxy = self.sheet.getsize()
+        self.scrollto(self.left,
+                      scrolled(self.top, self.rows, maxy, args))
+
+    def see(self, x, y):
+        "Scroll so that cell (x, y) is in view."
+        left, top = self.left, self.top
+        if x < left:
+            left = x
+        elif x >= left + self.columns:
+            left = x - self.columns + 1
+        if y < top:
+            top = y
+        elif y >= top + self.rows:
+            top = y - self.rows + 1
+        self.scrollto(left, top)
+
+    def scrollto(self, left, top):
+        "Show the sheet from column left and row top on."
+        left = max(1, left)
+        top = max(1, top)
+        if (left, top) == (self.left, self.top):
+            return
+        self.clearfocus()
+        self.gridcells = {}
+        for (i, j), cell in self.labels.items():
+            if i == 0:
+                x, y = 0, j + top - 1
+                if top != self.top:
+                    cell['text'] = str(y)
+            elif j == 0:
+                x, y = i + left - 1, 0
+                if left != self.left:
+                    cell['text'] = colnum2name(x)
+            else:
+                x, y = i + left - 1, j + top - 1
+            cell.__x = x
+            cell.__y = y
+            self.gridcells[x, y] = cell
+        self.left = left
+        self.top = top
+        self.showfocus()
+        self.refresh()
+
     def sync(self):
         "Fill the GUI cells from the sheet cells."
         self.sheet.recalc()
+        self.refresh()
+
+    def refresh(self):
+        "Update the GUI cells whose text changed, and the scroll bars."
         for (x, y), gridcell in self.gridcells.items():
             if x == 0 or y == 0:
                 continue
-            cell = self.sheet.getcell(x, y)
-            if cell is None:
-                gridcell['text'] = ""
-            else:
-                if hasattr(cell, 'format'):
-                    text, alignment = cell.format()
-                else:
-                    text, alignment = str(cell), LEFT
-                gridcell['text'] = text
-                gridcell['anchor'] = align2anchor[alignment]
+            shown = self.sheet.formatcell(x, y) or ("", LEFT)
+            if shown != gridcell.__shown:
+                text, alignment = shown
+                gridcell.configure(text=text, anchor=align2anchor[alignment])
+                gridcell.__shown = shown
+        maxx, maxy = self.sheet.getsize()
+        self.hbar.set(*scrollfractions(self.left, self.columns, maxx))
+        self.vbar.set(*scrollfractions(self.top, self.rows, maxy))
+
+def scrollextent(first, size, used):
+    "Return how many rows or columns the scroll bars range over."
+    return max(used, first + size - 1) + size
+
+def scrollfractions(first, size, used):
+    "Return the (first, last) fractions of a scroll bar's range in view."
+    total = scrollextent(first, size, used)
+    return (first - 1) / total, (first - 1 + size) / total
+
+def scrolled(first, size, used, args):
+    """Return the first row or column to show after a scroll bar command.
+
+    The args are those Tk passes to xview() or yview(): "moveto" and a
+    fraction, or "scroll", a number, and "units" or "pages".
+    """
+    if args[0] == "moveto":
+        return int(float(args[1]) * scrollextent(first, size, used)) + 1
+    n = int(args[1])
+    if args[2] == "pages":
+        n *= size
+    return first + n
 
 
 def test_basic():
@@ -813,7 +2305,147 @@ def test_basic():
 ##        print "Loading from sheet1.xml"
 ##        a.load("sheet1.xml")
     a.display()
-    a.save("sheet1.xml")
+    # save into a scratch directory, so the test leaves nothing behind
+    import tempfile
+    with tempfile.TemporaryDirectory() as dir:
+        a.save(os.path.join(dir, "sheet1.xml"))
+
+def test_roundtrip():
+    "Check that saving and loading both formats reproduces the sheet."
+    import tempfile
+    a = Sheet()
+    a.setcell(1, 1, NumericCell(42))
+    a.setcell(2, 1, NumericCell(2.5, "%.2f", CENTER))
+    a.setcell(3, 1, NumericCell(1+2j))
+    a.setcell(1, 2, StringCell('<a & "b">'))
+    a.setcell(2, 2, StringCell("right", "%s", RIGHT))
+    a.setcell(3, 2, FormulaCell("sum(A1:B1)*C1", "%.1f", LEFT))
+    a.setcell(7, 9, FormulaCell("cell(1, 1) + 1"))
+    expected = a.xml()
+    with tempfile.TemporaryDirectory() as dir:
+        for name in "sheet.xml", "sheet" + BINARY_SUFFIX:
+            filename = os.path.join(dir, name)
+            a.save(filename)
+            b = Sheet()
+            b.load(filename)
+            assert b.xml() == expected, name
+            b.recalc()
+            assert b.getcell(3, 2).value == 44.5*(1+2j)
+            assert b.getcell(7, 9).value == 43
+        # CSV keeps only the values, and infers their types by column
+        a = Sheet()
+        a.setcell(1, 1, StringCell("n"))
+        a.setcell(2, 1, StringCell("n/2"))
+        for y in range(2, 6):
+            a.setcell(1, y, NumericCell(y))
+            a.setcell(2, y, FormulaCell("A%d/2" % y))
+        a.setcell(3, 3, StringCell("a, \"b\""))
+        filename = os.path.join(dir, "sheet" + CSV_SUFFIX)
+        a.save(filename)
+        b = Sheet()
+        with open(filename, newline='') as f:
+            assert b.readcsv(f) == 5
+        assert b.getcell(2, 1).text == "n/2"
+        assert b.getcell(1, 4).value == 4
+        assert b.getcell(2, 4).value == 2.0
+        assert b.getcell(3, 3).text == 'a, "b"'
+        assert (3, 2) not in b.cells
+
+def test_cycles():
+    "Check that only formulas referring to each other are in a cycle."
+    a = Sheet()
+    a.setcell(1, 1, FormulaCell("B1+C1"))
+    a.setcell(2, 1, FormulaCell("A1"))
+    a.setcell(3, 1, FormulaCell("1+1"))
+    a.recalc()
+    assert a.cycles == [["A1", "B1"]], a.cycles
+    assert a.getcell(3, 1).value == 2
+    # A formula waiting alongside another isn't a cycle with it
+    a = Sheet()
+    a.setcell(1, 2, FormulaCell("B2+C2"))
+    a.setcell(2, 2, FormulaCell("C2*10"))
+    a.setcell(3, 2, FormulaCell("cell(4, 2)"))
+    a.setcell(4, 2, NumericCell(5))
+    a.evaluate([(1, 2)])
+    assert a.cycles == [] and a.getcell(1, 2).value == 55
+    # Full and incremental recalcs agree
+    a = Sheet()
+    a.setcell(1, 1, NumericCell(1))
+    a.setcell(2, 1, FormulaCell("A1+C1+D1"))
+    a.setcell(3, 1, FormulaCell("B1"))
+    a.setcell(4, 1, FormulaCell("A1*2"))
+    a.recalc()
+    full = {xy: cell.value for xy, cell in a.cells.items()}
+    a.setcell(1, 1, NumericCell(1))
+    a.recalc()
+    assert {xy: cell.value for xy, cell in a.cells.items()} == full
+    assert full[4, 1] == 2 and a.cycles == [["B1", "C1"]], a.cycles
+
+def bench_recalc(rows=1000, columns=100):
+    """Time single-cell edits on a sheet of rows*(columns-1) formulas.
+
+    Column A holds numbers; every other cell adds one to its left neighbour,
+    so an edit in column A affects one row of formulas, and an edit in the
+    last column affects none.
+    """
+    a = Sheet()
+    for y in range(1, rows+1):
+        a.setcell(1, y, NumericCell(y))
+        for x in range(2, columns+1):
+            a.setcell(x, y, FormulaCell("%s+1" % cellname(x-1, y)))
+    t0 = time.perf_counter()
+    a.recalc()
+    t1 = time.perf_counter()
+    print("full recalc of %d formulas: %.3f s" % (rows*(columns-1), t1-t0))
+    print("  compiled %(compiled)d formulas in %(compile).3f s, "
+          "evaluated in %(evaluate).3f s" % a.timings)
+    for x, affected in (1, columns-1), (columns//2, columns-columns//2), \
+                       (columns, 1):
+        n = 100
+        t0 = time.perf_counter()
+        for i in range(n):
+            y = i*rows//n + 1
+            a.setcell(x, y, NumericCell(i))
+            a.recalc()
+        t1 = time.perf_counter()
+        print("edit in column %s (%d affected cells): %.3f ms" %
+              (colnum2name(x), affected, (t1-t0)*1000/n))
+        print("  last recalc: compiled %(compiled)d of %(formulas)d formulas "
+              "in %(compile).6f s, evaluated in %(evaluate).6f s" % a.timings)
+    assert a.getcell(columns, 2).value == columns + 1
+
+def bench_parallel(rows=2000, columns=50, jobs=None):
+    """Time recalc() of a sheet of independent rows on 1, 2, 4... processes.
+
+    Every row is its own group: each cell adds a power of its left
+    neighbour's square root to its row's first number.
+    """
+    import concurrent.futures
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    a = Sheet()
+    for y in range(1, rows+1):
+        a.setcell(1, y, NumericCell(y))
+        for x in range(2, columns+1):
+            formula = "A%d + (%s ** 0.5) ** %d" % (y, cellname(x-1, y), x % 7)
+            a.setcell(x, y, FormulaCell(formula))
+    t0 = time.perf_counter()
+    a.recalc()
+    serial = time.perf_counter() - t0
+    expected = {xy: cell.value for xy, cell in a.cells.items()}
+    print("%d formulas, sequential: %.3f s" % (rows*(columns-1), serial))
+    n = 1
+    while n <= jobs:
+        with concurrent.futures.ProcessPoolExecutor(n) as pool:
+            pool.submit(int).result() # start the workers
+            a.changed = None
+            t0 = time.perf_counter()
+            a.recalc(pool)
+            elapsed = time.perf_counter() - t0
+        assert {xy: cell.value for xy, cell in a.cells.items()} == expected
+        print("%2d processes: %.3f s, speedup %.2f" %
+              (n, elapsed, serial/elapsed))
+        n *= 2
 
 def test_gui():
     "GUI test."
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for the ss1 spreadsheet.
+
+Synthetic sheets of a few shapes are built, and the main sheet operations
+are timed on each of them.  The results are written as JSON, so runs can be
+kept and compared to catch regressions.
+
+Usage: %(PROGRAM)s [-s scale] [-r repeat] [-o file] [-p] [-h] [shape ...]
+
+The shapes are:
+    fanout      one number, and formulas that all refer to it
+    chain       a column of formulas each referring to the one above
+    ranges      a block of numbers, and formulas summing growing ranges of it
+    grid        a grid of formulas each referring to its left neighbour
+    inserts     a grid like the above, timed inserting many rows
+
+By default all of them are run.
+
+Where:
+    --scale n
+    -s n
+        Multiply the size of every sheet by n (default 1).
+
+    --repeat n
+    -r n
+        Run every benchmark n times and keep the fastest time (default 3).
+
+    --output file
+    -o file
+        Write the JSON to file instead of standard output.
+
+    --profile
+    -p
+        Also time the evaluation of every formula, and add the slowest
+        ones of each sheet to the results.  The recalc times then include
+        the cost of profiling.
+
+    --help
+    -h
+        print this message
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import getopt
+import platform
+import tempfile
+import contextlib
+
+from ss1 import Sheet, NumericCell, FormulaCell, cellname, BINARY_SUFFIX
+
+PROGRAM = sys.argv[0]
+
+# Number of edits, moves and row insertions timed and averaged.  Moves and
+# insertions renumber the formulas referring into the moved cells and then
+# recalculate the ones that depend on those, so they cost in proportion to
+# the cells moved rather than the whole sheet
+EDITS = 20
+MOVES = 4
+INSERTS = 10
+
+# Number of slowest formulas reported by --profile
+HOTSPOTS = 10
+
+
+def usage(code, msg=''):
+    print(__doc__ % globals())
+    if msg:
+        print(msg)
+    sys.exit(code)
+
+
+
+def fanout(scale):
+    "Return a sheet where every formula refers to A1, and the cell to edit."
+    sheet = Sheet()
+    sheet.setcell(1, 1, NumericCell(1))
+    items = []
+    for i in range(10000 * scale):
+        x, y = 2 + i % 10, 1 + i // 10
+        items.append(((x, y), FormulaCell("A1 * %d" % i)))
+    sheet.setcells(items)
+    return sheet, (1, 1)
+
+def chain(scale):
+    "Return a sheet of one long chain of formulas, and the cell to edit."
+    sheet = Sheet()
+    sheet.setcell(1, 1, NumericCell(1))
+    sheet.setcells([((1, y), FormulaCell("A%d + 1" % (y-1)))
+                    for y in range(2, 10000 * scale + 1)])
+    return sheet, (1, 1)
+
+def ranges(scale):
+    """Return a sheet of formulas over ranges, and the cell to edit.
+
+    Columns A to T hold numbers; every cell of column U sums the block
+    from A1 to its own row, so the ranges grow down the column.
+    """
+    sheet = Sheet()
+    rows = 1000 * scale
+    items = []
+    for y in range(1, rows+1):
+        for x in range(1, 21):
+            items.append(((x, y), NumericCell(x * y)))
+        items.append(((21, y), FormulaCell("sum(A1:T%d)" % y)))
+    sheet.setcells(items)
+    return sheet, (1, rows)
+
+def grid(scale):
+    "Return a grid of formulas adding one to their left neighbour."
+    sheet = Sheet()
+    items = []
+    for y in range(1, 500 * scale + 1):
+        items.append(((1, y), NumericCell(y)))
+        for x in range(2, 21):
+            items.append(((x, y), FormulaCell("%s + 1" % cellname(x-1, y))))
+    sheet.setcells(items)
+    return sheet, (1, 1)
+
+SHAPES = {
+    'fanout': fanout,
+    'chain': chain,
+    'ranges': ranges,
+    'grid': grid,
+    'inserts': grid,
+    }
+
+
+
+def timed(func, *args):
+    "Return the seconds func(*args) takes."
+    t0 = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t0
+
+def edits(sheet, x, y):
+    "Set (x, y) to new numbers and recalculate, EDITS times."
+    for i in range(EDITS):
+        sheet.setcell(x, y, NumericCell(i))
+        sheet.recalc()
+
+def moves(sheet):
+    "Move the lower half of the sheet one row down and back, MOVES times."
+    maxx, maxy = sheet.getsize()
+    for i in range(MOVES // 2):
+        sheet.movecells(1, maxy//2, maxx, maxy, 0, 1)
+        sheet.recalc()
+        sheet.movecells(1, maxy//2+1, maxx, maxy+1, 0, -1)
+        sheet.recalc()
+
+def inserts(sheet):
+    "Insert rows at the top and in the middle, INSERTS times."
+    for i in range(INSERTS):
+        maxx, maxy = sheet.getsize()
+        sheet.insertrows(1 if i % 2 else maxy//2, 1)
+        sheet.recalc()
+
+def display(sheet, x1=1, y1=1, x2=None, y2=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sheet.display(x1, y1, x2, y2)
+
+def bench(shape, scale=1, profile=False):
+    """Time the operations on a sheet of the named shape.
+
+    Returns a dictionary of sizes and timings, in seconds; the times of
+    edits, moves and insertions are per operation.
+    """
+    results = {}
+    t0 = time.perf_counter()
+    sheet, (x, y) = SHAPES[shape](scale)
+    results['build'] = time.perf_counter() - t0
+    results['cells'] = len(sheet.cells)
+    results['formulas'] = len(sheet.rangeindex.formulas)
+    if profile:
+        sheet.profile = {}
+    results['recalc'] = timed(sheet.recalc)
+    if profile:
+        results['hotspots'] = [
+            {'cell': name, 'formula': formula, 'seconds': seconds}
+            for seconds, name, formula in sheet.hotspots(HOTSPOTS)]
+        sheet.profile = None
+    if shape == 'inserts':
+        results['insertrows'] = timed(inserts, sheet) / INSERTS
+        return results
+    results['edit'] = timed(edits, sheet, x, y) / EDITS
+    results['movecells'] = timed(moves, sheet) / MOVES
+    results['display'] = timed(display, sheet, 1, 1, 10, 40)
+    results['display_all'] = timed(display, sheet)
+    results['xml'] = timed(sheet.xml)
+    with tempfile.TemporaryDirectory() as dir:
+        for suffix in '.xml', BINARY_SUFFIX:
+            filename = os.path.join(dir, 'sheet' + suffix)
+            name = suffix.lstrip('.')
+            results['save_' + name] = timed(sheet.save, filename)
+            results['load_' + name] = timed(Sheet().load, filename)
+    return results
+
+def run(shapes, scale=1, repeat=3, profile=False):
+    """Run the benchmarks, returning a dictionary ready for JSON.
+
+    Every timing is the fastest of repeat runs.
+    """
+    results = {}
+    for shape in shapes:
+        best = {}
+        for i in range(repeat):
+            for key, value in bench(shape, scale, profile).items():
+                if key not in best or (isinstance(value, float) and
+                                       value < best[key]):
+                    best[key] = value
+        results[shape] = best
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'scale': scale,
+        'repeat': repeat,
+        'results': results,
+        }
+
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            'hs:r:o:p',
+            ['scale=', 'repeat=', 'output=', 'profile', 'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+
+    scale = 1
+    repeat = 3
+    outfile = None
+    profile = False
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-s', '--scale'):
+            try:
+                scale = int(arg)
+            except ValueError:
+                scale = 0
+            if scale < 1:
+                usage(1, 'Bad scale: %s' % arg)
+        elif opt in ('-r', '--repeat'):
+            try:
+                repeat = int(arg)
+            except ValueError:
+                repeat = 0
+            if repeat < 1:
+                usage(1, 'Bad repeat count: %s' % arg)
+        elif opt in ('-o', '--output'):
+            outfile = arg
+        elif opt in ('-p', '--profile'):
+            profile = True
+
+    for shape in args:
+        if shape not in SHAPES:
+            usage(1, 'Unknown shape: %s' % shape)
+    results = run(args or list(SHAPES), scale, repeat, profile)
+    text = json.dumps(results, indent=2)
+    if outfile is None:
+        print(text)
+    else:
+        with open(outfile, 'w') as f:
+            f.write(text + '\n')
+
+
+
+if __name__ == '__main__':
+    main()
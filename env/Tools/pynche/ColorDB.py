@@ -9,6 +9,10 @@ format of the file is.  If it can't figure out the file format, or it has
 trouble reading the file, None is returned.  You can pass get_colordb() an
 optional filetype argument.
 
+Parsed databases are also saved in a compiled form next to the original file,
+and get_colordb() uses that instead of parsing the text again for as long as
+the original file is unchanged.  Pass compiled=False to always parse.
+
 Supporte file types are:
 
     X_RGB_TXT -- X Consortium rgb.txt format files.  Three columns of numbers
@@ -21,9 +25,24 @@ color formats, and for calculating other color values.
 """
 
 import sys
+import os
 import re
+import mmap
+import array
+import marshal
+import struct
+import hashlib
+import heapq
+import math
+import functools
+import bisect
 from types import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class BadColor(Exception):
     pass
 
@@ -31,6 +50,12 @@ DEFAULT_DB = None
 SPACE = ' '
 COMMASPACE = ', '
 
+# distance metrics understood by nearest() and nearest_many().  `rgb' is the
+# squared distance between the r/g/b values, `cie76' is the Euclidean
+# distance in CIELAB space and `ciede2000' is the CIE's 2000 color difference
+# formula, which tracks perceived differences best but is the slowest.
+METRICS = ('rgb', 'cie76', 'ciede2000')
+
 
 
 # generic class
@@ -71,6 +96,46 @@ class ColorDB:
             # add to byname lookup
             self.__byname[keyname] = key
             lineno = lineno + 1
+        self.__build_index()
+
+    def __build_index(self):
+        # The spatial index used by nearest().  Points are kept in the same
+        # order as the exhaustive search visits them, so that ties resolve to
+        # the same name.  Each point is its entry's own triplet, which a
+        # name may not map back to if the name is given to several colors.
+        self.__names = []
+        points = []
+        for key, (name, aliases) in self.__byrgb.items():
+            self.__names.append(name)
+            points.append(key)
+        self.__tree = _KDTree(points)
+        # the same points as a matrix, for nearest_many()
+        self.__palette = None
+        self.__lut = None
+        # the CIELAB palette is only computed when a perceptual metric is
+        # first used
+        self.__labtree = None
+        self.__labpalette = None
+        # the name search index is also built on demand
+        self.__nameindex = None
+        if numpy is not None and points:
+            self.__palette = numpy.array(points, dtype=numpy.float64)
+            self.__palettenorms = (self.__palette ** 2).sum(axis=1)
+
+    @classmethod
+    def _from_compiled(cls, name, byrgb, byname):
+        # create an instance from the dictionaries saved by _compiled(),
+        # without reading the textual database at all
+        self = cls.__new__(cls)
+        self.__name = name
+        self.__byrgb = byrgb
+        self.__byname = byname
+        self.__allnames = None
+        self.__build_index()
+        return self
+
+    def _compiled(self):
+        return self.__byrgb, self.__byname
 
     # override in derived classes
     def _extractrgb(self, mo):
@@ -97,15 +162,202 @@ class ColorDB:
         except KeyError:
             raise BadColor(name) from None
 
-    def nearest(self, red, green, blue):
-        """Return the name of color nearest (red, green, blue)"""
-        # BAW: should we use Voronoi diagrams, Delaunay triangulation, or
-        # octree for speeding up the locating of nearest point?  Exhaustive
-        # search is inefficient, but seems fast enough.
+    def nearest(self, red, green, blue, metric='rgb'):
+        """Return the name of color nearest (red, green, blue)
+
+        metric is one of the names in METRICS.  `ciede2000' is an
+        approximation: only the _DE2000CANDIDATES colors nearest in CIELAB
+        space are compared with the much more expensive CIEDE2000 formula,
+        and the two distances rank colors differently often enough that the
+        CIEDE2000 minimum is sometimes not among them.  Against the X11
+        database about 3% of random colors get a slightly worse match than
+        an exhaustive CIEDE2000 search would give.
+        """
+        if metric != 'rgb':
+            i = self.__lab_nearest((red, green, blue), metric)
+            if i is None:
+                return ''
+            return self.__names[i]
+        lut = self.__lut
+        if (lut is not None and 0 <= red <= 255 and 0 <= green <= 255
+                and 0 <= blue <= 255):
+            return self.__names[lut[(red << 16) | (green << 8) | blue]]
+        i = self.__tree.nearest((red, green, blue))
+        if i is None:
+            return ''
+        return self.__names[i]
+
+    def nearest_many(self, rgbs, indices=False, metric='rgb'):
+        """Return the nearest color for each of a sequence of rgb values.
+
+        rgbs can be an N x 3 NumPy array, a sequence of (red, green, blue)
+        tuples, or a buffer of packed 8-bit r/g/b triplets.  A list of names
+        is returned, or with indices true, their positions in palette().  For
+        the `rgb' metric, the answers are exactly the ones nearest() would
+        give; the perceptual metrics may resolve near ties differently, and
+        `ciede2000' is approximate in the same way as in nearest().
+        """
+        if metric not in METRICS:
+            raise ValueError('unknown metric: %r' % (metric,))
+        if self.__palette is None:
+            if isinstance(rgbs, (bytes, bytearray, memoryview)):
+                data = memoryview(rgbs).cast('B')
+                rgbs = [tuple(data[i:i+3]) for i in range(0, len(data), 3)]
+            tree = self.__tree
+            lut = self.__lut
+            if metric != 'rgb':
+                result = [self.__lab_nearest(rgb, metric) for rgb in rgbs]
+            elif lut is None:
+                result = [tree.nearest(rgb) for rgb in rgbs]
+            else:
+                result = []
+                for rgb in rgbs:
+                    red, green, blue = rgb
+                    if (0 <= red <= 255 and 0 <= green <= 255
+                            and 0 <= blue <= 255):
+                        result.append(lut[(red << 16) | (green << 8) | blue])
+                    else:
+                        result.append(tree.nearest(rgb))
+            if indices:
+                return result
+            names = self.__names
+            return [names[i] for i in result]
+        if isinstance(rgbs, (bytes, bytearray, memoryview)):
+            queries = numpy.frombuffer(rgbs, dtype=numpy.uint8)
+        else:
+            queries = numpy.asarray(rgbs)
+        queries = queries.reshape(-1, 3)
+        if metric != 'rgb':
+            self.__lab_index()
+            result = self.__search_many(triplets_to_lab(queries),
+                                        self.__labpalette,
+                                        self.__labnorms, metric)
+        elif (self.__lut is not None and len(queries) and
+                queries.min() >= 0 and queries.max() <= 255):
+            keys = queries.astype(numpy.intp)
+            keys = (keys[:, 0] << 16) | (keys[:, 1] << 8) | keys[:, 2]
+            result = numpy.frombuffer(self.__lut, dtype=numpy.uint16)[keys]
+            result = result.astype(numpy.intp)
+        else:
+            result = self.__search_many(queries.astype(numpy.float64),
+                                        self.__palette, self.__palettenorms)
+        if indices:
+            return result
+        return numpy.array(self.__names, dtype=object)[result].tolist()
+
+    def __search_many(self, queries, palette, norms, metric='rgb'):
+        result = numpy.empty(len(queries), dtype=numpy.intp)
+        k = min(self._DE2000CANDIDATES, len(palette))
+        # |q - p|**2 == |q|**2 - 2 q.p + |p|**2, and |q|**2 is the same for
+        # every palette entry, so it can be dropped when comparing.  The
+        # products are small integers, so doing them in doubles (which lets
+        # BLAS do the work) is still exact, and argmin() picks the first of
+        # equal minimums, just like nearest() does.  Queries are done in
+        # chunks to keep the distance matrix to a few megabytes.
+        chunk = max(1, self._CHUNKCELLS // len(palette))
+        for start in range(0, len(queries), chunk):
+            block = queries[start:start+chunk]
+            distances = norms - 2 * block.dot(palette.T)
+            if metric != 'ciede2000':
+                result[start:start+chunk] = distances.argmin(axis=1)
+                continue
+            # refine the k nearest in CIELAB with the CIEDE2000 formula.
+            # Candidates are sorted so that ties go to the lowest index.
+            candidates = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+            candidates.sort(axis=1)
+            differences = _ciede2000_array(block[:, None, :],
+                                           palette[candidates])
+            best = differences.argmin(axis=1)
+            result[start:start+chunk] = candidates[numpy.arange(len(block)),
+                                                   best]
+        return result
+
+    # Number of CIELAB neighbors compared with the CIEDE2000 formula.  The
+    # two metrics disagree enough that this is a heuristic, not a bound:
+    # against the full X11 database about 3% of random colors (28 of 1000
+    # in one test) get a slightly worse match than an exhaustive CIEDE2000
+    # search would give, and doubling it halves that.
+    _DE2000CANDIDATES = 16
+
+    def __lab_index(self):
+        if self.__labtree is None:
+            labs = [triplet_to_lab(p) for p in self.__tree.points()]
+            self.__labtree = _KDTree(labs)
+            if numpy is not None and labs:
+                self.__labpalette = numpy.array(labs)
+                self.__labnorms = (self.__labpalette ** 2).sum(axis=1)
+        return self.__labtree
+
+    def __lab_nearest(self, rgbtuple, metric):
+        tree = self.__lab_index()
+        lab = triplet_to_lab(rgbtuple)
+        if metric == 'cie76':
+            return tree.nearest(lab)
+        if metric != 'ciede2000':
+            raise ValueError('unknown metric: %r' % (metric,))
+        labs = tree.points()
+        best = None
+        bestdiff = -1
+        for i in tree.knearest(lab, self._DE2000CANDIDATES):
+            diff = delta_e_ciede2000(lab, labs[i])
+            if (best is None or diff < bestdiff or
+                    (diff == bestdiff and i < best)):
+                best = i
+                bestdiff = diff
+        return best
+
+    # number of elements in each nearest_many() distance matrix
+    _CHUNKCELLS = 1 << 20
+
+    def load_lut(self, filename=None, build=True):
+        """Make nearest() a table lookup for every 8-bit rgb value.
+
+        The table holds the palette() index of the nearest color for all
+        2**24 colors.  It is stored in filename, by default the database file
+        name with `.lut' appended, and is memory mapped from there by later
+        processes.  The table is keyed by a hash of the database file, so it
+        is rebuilt whenever the database changes.  If the table can't be
+        written, it is kept in memory for this process only.  Building it
+        takes a few seconds with NumPy, and several minutes without.  If
+        build is false, a table already written to filename is mapped, and
+        nothing else is done.
+
+        Returns false if the database is too large for a 16-bit table, or if
+        build is false and filename holds no table for this database.
+        """
+        if len(self.__names) > 0xffff:
+            return False
+        if filename is None:
+            filename = self.__name + '.lut'
+        h = hashlib.sha1(self.__class__.__name__.encode())
+        with open(self.__name, 'rb') as fp:
+            h.update(fp.read())
+        header = struct.pack(_LUTHEADER, _LUTMAGIC, h.digest(),
+                             len(self.__names))
+        lut = _map_lut(filename, header)
+        if lut is None:
+            if not build:
+                return False
+            lut = _build_lut(self.__tree)
+            try:
+                _write_atomically(filename, header, lut)
+            except OSError:
+                pass
+            else:
+                lut = _map_lut(filename, header)
+        self.__lut = lut
+        return True
+
+    def palette(self):
+        """Return the names nearest_many() indices refer to, in order."""
+        return self.__names
+
+    def _exhaustive_nearest(self, red, green, blue):
+        # The original linear scan over every color.  nearest() must always
+        # agree with this; it is kept for testing and benchmarking the index.
         nearest = -1
         nearest_name = ''
-        for name, aliases in self.__byrgb.values():
-            r, g, b = self.__byname[name.lower()]
+        for (r, g, b), (name, aliases) in self.__byrgb.items():
             rdelta = red - r
             gdelta = green - g
             bdelta = blue - b
@@ -124,6 +376,30 @@ class ColorDB:
             self.__allnames.sort(key=str.lower)
         return self.__allnames
 
+    def complete(self, prefix, limit=None):
+        """Return the names and aliases that start with prefix.
+
+        Case is ignored, and the names come back sorted the same way as
+        unique_names().  At most limit names are returned.
+        """
+        return self.__name_index().complete(prefix, limit)
+
+    def search(self, fragment, limit=None):
+        """Return the names and aliases that contain fragment.
+
+        Like complete(), but the fragment may appear anywhere in the name.
+        """
+        return self.__name_index().search(fragment, limit)
+
+    def __name_index(self):
+        if self.__nameindex is None:
+            names = []
+            for name, aliases in self.__byrgb.values():
+                names.append(name)
+                names.extend(aliases)
+            self.__nameindex = _NameIndex(names)
+        return self.__nameindex
+
     def aliases_of(self, red, green, blue):
         try:
             name, aliases = self.__byrgb[(red, green, blue)]
@@ -159,6 +435,409 @@ class WebsafeDB(ColorDB):
         return mo.group('hexrgb').upper()
 
 
+class MergedColorDB(ColorDB):
+    """The colors of several databases, as made by ColorDBSet.merged()."""
+
+    def load_lut(self, filename=None, build=True):
+        # there is no single database file to key the table by
+        return False
+
+
+
+class ColorDBSet:
+    """Several color databases loaded at once.
+
+    Each database is known by its source, which is its file name.  Loading a
+    source that is already in the set, or switching between sources, costs
+    nothing.  merged() returns one database holding the colors of every
+    source; a triplet defined by more than one source has a single entry,
+    with all of its names in one alias list.  A name that an earlier source
+    gives to a different triplet is qualified with the base name of the
+    later source, as in `Green (html40colors.txt)', so that every name
+    finds the color it names.  sources_of() tells which sources define a
+    triplet.
+    """
+
+    def __init__(self):
+        # key is source, value is ColorDB, in the order they were added
+        self.__colordbs = {}
+        # key is (red, green, blue) tuple, value is [sources]
+        self.__provenance = {}
+        # built on demand
+        self.__merged = None
+
+    def add(self, colordb):
+        source = colordb.filename()
+        if source in self.__colordbs:
+            return
+        self.__colordbs[source] = colordb
+        byrgb, byname = colordb._compiled()
+        for key in byrgb:
+            self.__provenance.setdefault(key, []).append(source)
+        self.__merged = None
+
+    def load(self, file, filetype=None):
+        """Return the database for file, reading it only the first time.
+
+        Returns None if the file's format isn't recognized, like
+        get_colordb().
+        """
+        colordb = self.__colordbs.get(file)
+        if colordb is None:
+            colordb = get_colordb(file, filetype)
+            if colordb is not None:
+                self.add(colordb)
+        return colordb
+
+    def get(self, source):
+        return self.__colordbs[source]
+
+    def sources(self):
+        return list(self.__colordbs)
+
+    def sources_of(self, red, green, blue):
+        try:
+            return list(self.__provenance[(red, green, blue)])
+        except KeyError:
+            raise BadColor((red, green, blue)) from None
+
+    def merged(self):
+        if self.__merged is None:
+            byrgb = {}
+            byname = {}
+            for source, colordb in self.__colordbs.items():
+                dbbyrgb, dbbyname = colordb._compiled()
+                for key, (name, aliases) in dbbyrgb.items():
+                    names = []
+                    for alias in [name] + aliases:
+                        if byname.get(alias.lower(), key) != key:
+                            alias = '%s (%s)' % (alias,
+                                                 os.path.basename(source))
+                            if byname.get(alias.lower(), key) != key:
+                                continue
+                        byname[alias.lower()] = key
+                        names.append(alias)
+                    if not names:
+                        continue
+                    entry = byrgb.get(key)
+                    if entry is None:
+                        byrgb[key] = (names[0], names[1:])
+                        continue
+                    # the first source's name stays the primary name
+                    seen = {entry[0].lower()}
+                    seen.update(alias.lower() for alias in entry[1])
+                    for alias in names:
+                        if alias.lower() not in seen:
+                            seen.add(alias.lower())
+                            entry[1].append(alias)
+            sources = self.sources()
+            name = sources[0] if sources else ''
+            self.__merged = MergedColorDB._from_compiled(name, byrgb, byname)
+        return self.__merged
+
+
+
+class _KDTree:
+    """A static k-d tree over a sequence of 3-component points.
+
+    nearest() returns the index of the point with the smallest squared
+    Euclidean distance to the query.  Ties are broken in favor of the lowest
+    index, which is the same answer a linear scan with a strict `<'
+    comparison would give.
+    """
+
+    # points in a leaf are scanned linearly
+    _LEAFSIZE = 8
+
+    def __init__(self, points):
+        self.__points = [tuple(p) for p in points]
+        self.__root = self.__build(list(range(len(self.__points))), 0)
+
+    def __build(self, indices, depth):
+        # Leaves are lists of point indices, interior nodes are tuples of
+        # (axis, split, left, right).  Every point in the left subtree has
+        # points[axis] <= split and every point in the right has >= split.
+        if len(indices) <= self._LEAFSIZE:
+            return sorted(indices)
+        points = self.__points
+        axis = depth % 3
+        indices.sort(key=lambda i: points[i][axis])
+        mid = len(indices) // 2
+        split = points[indices[mid]][axis]
+        return (axis, split,
+                self.__build(indices[:mid], depth + 1),
+                self.__build(indices[mid:], depth + 1))
+
+    def __len__(self):
+        return len(self.__points)
+
+    def points(self):
+        return self.__points
+
+    def nearest(self, point):
+        """Return the index of the point nearest `point', or None if empty."""
+        if not self.__points:
+            return None
+        points = self.__points
+        x, y, z = point
+        best = None
+        bestdist = -1
+        stack = [(self.__root, 0)]
+        while stack:
+            node, mindist = stack.pop()
+            # a subtree can only hold a tie or better if it is no further
+            # away than the best distance seen so far
+            if best is not None and mindist > bestdist:
+                continue
+            if isinstance(node, list):
+                for i in node:
+                    px, py, pz = points[i]
+                    dx = x - px
+                    dy = y - py
+                    dz = z - pz
+                    distance = dx * dx + dy * dy + dz * dz
+                    if (best is None or distance < bestdist or
+                            (distance == bestdist and i < best)):
+                        best = i
+                        bestdist = distance
+                continue
+            axis, split, left, right = node
+            delta = point[axis] - split
+            if delta <= 0:
+                near, far = left, right
+            else:
+                near, far = right, left
+            # push the far side first so the near side is searched first
+            stack.append((far, max(mindist, delta * delta)))
+            stack.append((near, mindist))
+        return best
+
+    def knearest(self, point, k):
+        """Return the indices of the k points nearest `point', nearest first.
+
+        Points at the same distance are ordered by index.
+        """
+        points = self.__points
+        x, y, z = point
+        # a max-heap on (distance, index), holding the best k seen so far
+        heap = []
+        stack = [(self.__root, 0)]
+        while stack:
+            node, mindist = stack.pop()
+            if len(heap) == k and mindist > -heap[0][0]:
+                continue
+            if isinstance(node, list):
+                for i in node:
+                    px, py, pz = points[i]
+                    dx = x - px
+                    dy = y - py
+                    dz = z - pz
+                    distance = dx * dx + dy * dy + dz * dz
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-distance, -i))
+                    elif (distance, i) < (-heap[0][0], -heap[0][1]):
+                        heapq.heapreplace(heap, (-distance, -i))
+                continue
+            axis, split, left, right = node
+            delta = point[axis] - split
+            if delta <= 0:
+                near, far = left, right
+            else:
+                near, far = right, left
+            stack.append((far, max(mindist, delta * delta)))
+            stack.append((near, mindist))
+        heap.sort(reverse=True)
+        return [-i for distance, i in heap]
+
+
+
+class _NameIndex:
+    """Prefix and substring search over a set of names, ignoring case.
+
+    Prefixes are found by bisecting the sorted list of lower cased names.
+    Substrings are found through an index from every string of one to three
+    characters to the names containing it.  Only the names listed under the
+    rarest trigram of a longer fragment need to be checked.
+    """
+
+    def __init__(self, names):
+        entries = {}
+        for name in names:
+            entries.setdefault(name.lower(), name)
+        self.__keys = sorted(entries)
+        self.__names = [entries[key] for key in self.__keys]
+        self.__ngrams = None
+
+    def complete(self, prefix, limit=None):
+        keys = self.__keys
+        prefix = prefix.lower()
+        result = []
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(self.__names[i])
+            i += 1
+        return result
+
+    def search(self, fragment, limit=None):
+        keys = self.__keys
+        fragment = fragment.lower()
+        if not fragment:
+            candidates = range(len(keys))
+        else:
+            ngrams = self.__ngram_index()
+            n = min(len(fragment), 3)
+            candidates = None
+            for i in range(len(fragment) - n + 1):
+                postings = ngrams.get(fragment[i:i+n], ())
+                if candidates is None or len(postings) < len(candidates):
+                    candidates = postings
+        result = []
+        for i in candidates:
+            if limit is not None and len(result) >= limit:
+                break
+            if fragment in keys[i]:
+                result.append(self.__names[i])
+        return result
+
+    def __ngram_index(self):
+        if self.__ngrams is None:
+            # posting lists are in sorted name order, like the results
+            ngrams = {}
+            for i, key in enumerate(self.__keys):
+                found = set()
+                for n in (1, 2, 3):
+                    for j in range(len(key) - n + 1):
+                        found.add(key[j:j+n])
+                for ngram in found:
+                    ngrams.setdefault(ngram, []).append(i)
+            self.__ngrams = ngrams
+        return self.__ngrams
+
+
+
+# The nearest color lookup table is a header followed by 2**24 native
+# endian unsigned shorts, one for each (red << 16 | green << 8 | blue).  The
+# header is a magic string, which includes the byte order, the SHA-1 digest
+# of the database file, and the number of colors in the palette.
+_LUTHEADER = '=8s20sI'
+_LUTMAGIC = b'PYNCHLU' + sys.byteorder[0].encode()
+_LUTSIZE = 1 << 24
+
+def _map_lut(filename, header):
+    # return a memoryview over the mapped table, or None if there isn't a
+    # valid one in the file
+    try:
+        fp = open(filename, 'rb')
+    except OSError:
+        return None
+    with fp:
+        if fp.read(len(header)) != header:
+            return None
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+    if len(mm) != len(header) + 2 * _LUTSIZE:
+        mm.close()
+        return None
+    return memoryview(mm)[len(header):].cast('H')
+
+
+def _write_atomically(filename, *chunks):
+    # write to a temporary file and rename it into place, so that other
+    # processes never map a partially written file
+    tmpfile = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        with open(tmpfile, 'wb') as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+        os.replace(tmpfile, filename)
+    except OSError:
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
+        raise
+
+
+def _build_lut(tree):
+    # The rgb cube is split into blocks of 8x8x8 colors.  For each block,
+    # only palette entries whose closest possible distance to the block is no
+    # more than the smallest farthest possible distance of any entry can be
+    # the nearest color of something in the block.  That is usually just a
+    # handful, and only they are compared for the block's colors.  Candidates
+    # stay in index order so ties still go to the lowest index.
+    points = tree.points()
+    if numpy is not None:
+        return _build_lut_numpy(points)
+    lut = array.array('H', bytes(2 * _LUTSIZE))
+    for r0 in range(0, 256, 8):
+        for g0 in range(0, 256, 8):
+            for b0 in range(0, 256, 8):
+                candidates = _lut_candidates(points, r0, g0, b0)
+                for red in range(r0, r0 + 8):
+                    for green in range(g0, g0 + 8):
+                        key = (red << 16) | (green << 8) | b0
+                        for blue in range(b0, b0 + 8):
+                            best = None
+                            for i, pr, pg, pb in candidates:
+                                dr = red - pr
+                                dg = green - pg
+                                db = blue - pb
+                                distance = dr * dr + dg * dg + db * db
+                                if best is None or distance < bestdist:
+                                    best = i
+                                    bestdist = distance
+                            lut[key] = best
+                            key += 1
+    return lut
+
+
+def _lut_candidates(points, r0, g0, b0):
+    mins = []
+    farthest = None
+    for i, point in enumerate(points):
+        near = far = 0
+        for p, lo in zip(point, (r0, g0, b0)):
+            hi = lo + 7
+            if p < lo:
+                near += (lo - p) ** 2
+            elif p > hi:
+                near += (p - hi) ** 2
+            far += max(p - lo, hi - p) ** 2
+        mins.append(near)
+        if farthest is None or far < farthest:
+            farthest = far
+    return [(i,) + tuple(points[i]) for i, near in enumerate(mins)
+            if near <= farthest]
+
+
+def _build_lut_numpy(points):
+    palette = numpy.array(points, dtype=numpy.int64)
+    lut = numpy.empty((256, 256, 256), dtype=numpy.uint16)
+    offsets = numpy.arange(8)
+    cube = numpy.stack(numpy.meshgrid(offsets, offsets, offsets,
+                                      indexing='ij'), axis=-1).reshape(-1, 3)
+    for r0 in range(0, 256, 8):
+        for g0 in range(0, 256, 8):
+            for b0 in range(0, 256, 8):
+                lo = numpy.array((r0, g0, b0))
+                hi = lo + 7
+                near = numpy.maximum(numpy.maximum(lo - palette, 0),
+                                     palette - hi)
+                near = (near ** 2).sum(axis=1)
+                far = numpy.maximum(palette - lo, hi - palette)
+                far = (far ** 2).sum(axis=1)
+                candidates = numpy.nonzero(near <= far.min())[0]
+                diff = (cube + lo)[:, None, :] - palette[candidates][None]
+                distances = (diff ** 2).sum(axis=2)
+                best = candidates[distances.argmin(axis=1)]
+                lut[r0:r0+8, g0:g0+8, b0:b0+8] = best.reshape(8, 8, 8)
+    return lut.reshape(-1)
+
+
 
 # format is a tuple (RE, SCANLINES, CLASS) where RE is a compiled regular
 # expression, SCANLINES is the number of header lines to scan, and CLASS is
@@ -172,8 +851,15 @@ FILETYPES = [
     (re.compile('Websafe'), WebsafeDB),
     ]
 
-def get_colordb(file, filetype=None):
+def get_colordb(file, filetype=None, compiled=True):
+    global DEFAULT_DB
     colordb = None
+    # use the compiled form of the database if it is up to date
+    if compiled:
+        colordb = _load_compiled(file, filetype)
+        if colordb is not None:
+            DEFAULT_DB = colordb
+            return colordb
     fp = open(file)
     try:
         line = fp.readline()
@@ -195,38 +881,162 @@ def get_colordb(file, filetype=None):
         colordb = class_(fp)
     finally:
         fp.close()
+    if compiled:
+        _save_compiled(file, colordb)
     # save a global copy
-    global DEFAULT_DB
     DEFAULT_DB = colordb
     return colordb
 
 
 
-_namedict = {}
+# A parsed database is saved in a compiled form next to the textual file,
+# with `.cdb' appended to the name.  The file is a header giving the
+# modification time and size of the textual database and the name of the
+# class that parsed it, followed by the database dictionaries in marshal
+# format.  The compiled file is only used while the time and size match.
+#
+# The file is memory mapped, but that only saves copying it into a bytes
+# object: marshal still builds the full dictionaries from the map, and the
+# k-d tree is rebuilt from them.  So loading a compiled database skips the
+# regular expression parsing, yet still takes time in proportion to the
+# number of colors.
+_CDBHEADER = '=8sqq32s'
+_CDBMAGIC = b'PYNCHCDB'
+
+def _compiled_name(file):
+    return file + '.cdb'
+
+
+def _classes():
+    classes = {}
+    for typere, class_ in FILETYPES:
+        classes[class_.__name__] = class_
+    return classes
+
+
+def _load_compiled(file, filetype=None):
+    try:
+        st = os.stat(file)
+        fp = open(_compiled_name(file), 'rb')
+    except OSError:
+        return None
+    with fp:
+        size = struct.calcsize(_CDBHEADER)
+        try:
+            magic, mtime, fsize, classname = struct.unpack(_CDBHEADER,
+                                                           fp.read(size))
+        except struct.error:
+            return None
+        if (magic != _CDBMAGIC or mtime != st.st_mtime_ns or
+                fsize != st.st_size):
+            return None
+        classname = classname.rstrip(b'\0').decode('ascii')
+        if filetype is None:
+            class_ = _classes().get(classname)
+        elif filetype[1].__name__ == classname:
+            class_ = filetype[1]
+        else:
+            class_ = None
+        if class_ is None:
+            return None
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+    with mm:
+        # unmarshal straight from the map; nothing refers to it afterwards
+        try:
+            byrgb, byname = marshal.loads(memoryview(mm)[size:])
+        except (EOFError, ValueError, TypeError):
+            return None
+    return class_._from_compiled(file, byrgb, byname)
+
+
+def _save_compiled(file, colordb):
+    # the compiled form is just an optimization, so failing to write it (say
+    # because the database lives in a read-only directory) isn't an error
+    if colordb is None or colordb.__class__.__name__ not in _classes():
+        return
+    try:
+        st = os.stat(file)
+        header = struct.pack(_CDBHEADER, _CDBMAGIC, st.st_mtime_ns,
+                             st.st_size,
+                             colordb.__class__.__name__.encode('ascii'))
+        _write_atomically(_compiled_name(file), header,
+                          marshal.dumps(colordb._compiled()))
+    except OSError:
+        pass
+
+
+
+# The hex digit pairs for every 8-bit value, and the value of every two digit
+# hex string in any mix of upper and lower case.
+_HEXBYTE = ['%02x' % i for i in range(256)]
+_HEXVALUE = {}
+for _hi in '0123456789abcdefABCDEF':
+    for _lo in '0123456789abcdefABCDEF':
+        _HEXVALUE[_hi + _lo] = int(_hi + _lo, 16)
+del _hi, _lo
 
+# Conversions are memoized in LRU caches of this size, so that long running
+# processes converting arbitrary colors don't grow without bound.
+_CACHESIZE = 4096
+
+@functools.lru_cache(maxsize=_CACHESIZE)
 def rrggbb_to_triplet(color):
     """Converts a #rrggbb color to the tuple (red, green, blue)."""
-    rgbtuple = _namedict.get(color)
-    if rgbtuple is None:
-        if color[0] != '#':
-            raise BadColor(color)
-        red = color[1:3]
-        green = color[3:5]
-        blue = color[5:7]
-        rgbtuple = int(red, 16), int(green, 16), int(blue, 16)
-        _namedict[color] = rgbtuple
-    return rgbtuple
+    if not color or color[0] != '#':
+        raise BadColor(color)
+    try:
+        return (_HEXVALUE[color[1:3]], _HEXVALUE[color[3:5]],
+                _HEXVALUE[color[5:7]])
+    except KeyError:
+        raise BadColor(color) from None
+
+
+def _rrggbb(red, green, blue):
+    if 0 <= red <= 255 and 0 <= green <= 255 and 0 <= blue <= 255:
+        return '#' + _HEXBYTE[red] + _HEXBYTE[green] + _HEXBYTE[blue]
+    return '#%02x%02x%02x' % (red, green, blue)
 
 
-_tripdict = {}
+@functools.lru_cache(maxsize=_CACHESIZE)
 def triplet_to_rrggbb(rgbtuple):
     """Converts a (red, green, blue) tuple to #rrggbb."""
-    global _tripdict
-    hexname = _tripdict.get(rgbtuple)
-    if hexname is None:
-        hexname = '#%02x%02x%02x' % rgbtuple
-        _tripdict[rgbtuple] = hexname
-    return hexname
+    return _rrggbb(*rgbtuple)
+
+
+def rrggbb_to_triplets(colors):
+    """Converts a sequence of #rrggbb colors to a list of triplets."""
+    hexvalue = _HEXVALUE
+    triplets = []
+    for color in colors:
+        if not color or color[0] != '#':
+            raise BadColor(color)
+        try:
+            triplets.append((hexvalue[color[1:3]], hexvalue[color[3:5]],
+                             hexvalue[color[5:7]]))
+        except KeyError:
+            raise BadColor(color) from None
+    return triplets
+
+
+def triplets_to_rrggbb(rgbtuples):
+    """Converts a sequence of triplets, or an N x 3 array, to #rrggbb colors.
+    """
+    if numpy is not None and isinstance(rgbtuples, numpy.ndarray):
+        rgbtuples = rgbtuples.reshape(-1, 3).tolist()
+    return [_rrggbb(red, green, blue) for red, green, blue in rgbtuples]
+
+
+def cache_info():
+    """Return the hit and miss statistics of the conversion caches.
+
+    The result maps the names of the memoized functions to the CacheInfo
+    named tuples from functools.lru_cache().
+    """
+    return {'rrggbb_to_triplet': rrggbb_to_triplet.cache_info(),
+            'triplet_to_rrggbb': triplet_to_rrggbb.cache_info()}
 
 
 def triplet_to_fractional_rgb(rgbtuple):
@@ -242,9 +1052,207 @@ def triplet_to_brightness(rgbtuple):
     return r*rgbtuple[0] + g*rgbtuple[1] + b*rgbtuple[2]
 
 
+
+# CIE XYZ coordinates of the D65 white point, used for sRGB
+_WHITE = (0.95047, 1.0, 1.08883)
+_EPSILON = (6 / 29) ** 3
+
+def triplet_to_lab(rgbtuple):
+    """Converts an 8-bit sRGB (red, green, blue) tuple to CIELAB (L, a, b)."""
+    linear = []
+    for c in rgbtuple:
+        c = c / 255
+        if c <= 0.04045:
+            linear.append(c / 12.92)
+        else:
+            linear.append(((c + 0.055) / 1.055) ** 2.4)
+    r, g, b = linear
+    xyz = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b,
+           0.2126729 * r + 0.7151522 * g + 0.0721750 * b,
+           0.0193339 * r + 0.1191920 * g + 0.9503041 * b)
+    fx, fy, fz = [_lab_f(t / n) for t, n in zip(xyz, _WHITE)]
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def _lab_f(t):
+    if t > _EPSILON:
+        return t ** (1 / 3)
+    return t / (3 * (6 / 29) ** 2) + 4 / 29
+
+
+def triplets_to_lab(rgbs):
+    """Converts a sequence of (red, green, blue) tuples to CIELAB.
+
+    With NumPy, an N x 3 array of floats is returned, otherwise a list of
+    (L, a, b) tuples.
+    """
+    if numpy is None:
+        return [triplet_to_lab(rgb) for rgb in rgbs]
+    c = numpy.asarray(rgbs, dtype=numpy.float64).reshape(-1, 3) / 255
+    linear = numpy.where(c <= 0.04045, c / 12.92,
+                         ((c + 0.055) / 1.055) ** 2.4)
+    matrix = numpy.array([[0.4124564, 0.3575761, 0.1804375],
+                          [0.2126729, 0.7151522, 0.0721750],
+                          [0.0193339, 0.1191920, 0.9503041]])
+    t = linear.dot(matrix.T) / numpy.array(_WHITE)
+    f = numpy.where(t > _EPSILON, numpy.cbrt(t),
+                    t / (3 * (6 / 29) ** 2) + 4 / 29)
+    return numpy.stack([116 * f[:, 1] - 16,
+                        500 * (f[:, 0] - f[:, 1]),
+                        200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def delta_e_cie76(lab1, lab2):
+    """Return the CIE76 color difference between two CIELAB colors."""
+    return math.sqrt(sum((c1 - c2) ** 2 for c1, c2 in zip(lab1, lab2)))
+
+
+def delta_e_ciede2000(lab1, lab2):
+    """Return the CIEDE2000 color difference between two CIELAB colors."""
+    # see Sharma, Wu and Dalal, "The CIEDE2000 Color-Difference Formula"
+    L1, a1, b1 = lab1
+    L2, a2, b2 = lab2
+    cbar7 = ((math.hypot(a1, b1) + math.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - math.sqrt(cbar7 / (cbar7 + 25 ** 7)))
+    a1 = (1 + g) * a1
+    a2 = (1 + g) * a2
+    c1 = math.hypot(a1, b1)
+    c2 = math.hypot(a2, b2)
+    h1 = math.degrees(math.atan2(b1, a1)) % 360 if c1 else 0.0
+    h2 = math.degrees(math.atan2(b2, a2)) % 360 if c2 else 0.0
+    dl = L2 - L1
+    dc = c2 - c1
+    if c1 * c2 == 0:
+        dh = 0.0
+        hbar = h1 + h2
+    else:
+        dh = h2 - h1
+        if dh > 180:
+            dh -= 360
+        elif dh < -180:
+            dh += 360
+        hbar = h1 + h2
+        if abs(h1 - h2) > 180:
+            hbar += 360 if hbar < 360 else -360
+        hbar /= 2
+    dh = 2 * math.sqrt(c1 * c2) * math.sin(math.radians(dh / 2))
+    lbar = (L1 + L2) / 2
+    cbar = (c1 + c2) / 2
+    t = (1 - 0.17 * math.cos(math.radians(hbar - 30))
+         + 0.24 * math.cos(math.radians(2 * hbar))
+         + 0.32 * math.cos(math.radians(3 * hbar + 6))
+         - 0.20 * math.cos(math.radians(4 * hbar - 63)))
+    dtheta = 30 * math.exp(-((hbar - 275) / 25) ** 2)
+    cbar7 = cbar ** 7
+    rc = 2 * math.sqrt(cbar7 / (cbar7 + 25 ** 7))
+    sl = 1 + 0.015 * (lbar - 50) ** 2 / math.sqrt(20 + (lbar - 50) ** 2)
+    sc = 1 + 0.045 * cbar
+    sh = 1 + 0.015 * cbar * t
+    rt = -math.sin(math.radians(2 * dtheta)) * rc
+    dl /= sl
+    dc /= sc
+    dh /= sh
+    return math.sqrt(dl * dl + dc * dc + dh * dh + rt * dc * dh)
+
+
+def _ciede2000_array(lab1, lab2):
+    # delta_e_ciede2000() over broadcast arrays of CIELAB colors
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    cbar7 = ((numpy.hypot(a1, b1) + numpy.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - numpy.sqrt(cbar7 / (cbar7 + 25 ** 7)))
+    a1 = (1 + g) * a1
+    a2 = (1 + g) * a2
+    c1 = numpy.hypot(a1, b1)
+    c2 = numpy.hypot(a2, b2)
+    h1 = numpy.where(c1 != 0, numpy.degrees(numpy.arctan2(b1, a1)) % 360, 0)
+    h2 = numpy.where(c2 != 0, numpy.degrees(numpy.arctan2(b2, a2)) % 360, 0)
+    dl = L2 - L1
+    dc = c2 - c1
+    zero = c1 * c2 == 0
+    dh = h2 - h1
+    dh = numpy.where(dh > 180, dh - 360, numpy.where(dh < -180, dh + 360, dh))
+    dh = numpy.where(zero, 0, dh)
+    hbar = h1 + h2
+    wrap = ~zero & (numpy.abs(h1 - h2) > 180)
+    hbar = numpy.where(wrap & (hbar < 360), hbar + 360,
+                       numpy.where(wrap, hbar - 360, hbar))
+    hbar = numpy.where(zero, hbar, hbar / 2)
+    dh = 2 * numpy.sqrt(c1 * c2) * numpy.sin(numpy.radians(dh / 2))
+    lbar = (L1 + L2) / 2
+    cbar = (c1 + c2) / 2
+    t = (1 - 0.17 * numpy.cos(numpy.radians(hbar - 30))
+         + 0.24 * numpy.cos(numpy.radians(2 * hbar))
+         + 0.32 * numpy.cos(numpy.radians(3 * hbar + 6))
+         - 0.20 * numpy.cos(numpy.radians(4 * hbar - 63)))
+    dtheta = 30 * numpy.exp(-((hbar - 275) / 25) ** 2)
+    cbar7 = cbar ** 7
+    rc = 2 * numpy.sqrt(cbar7 / (cbar7 + 25 ** 7))
+    sl = 1 + 0.015 * (lbar - 50) ** 2 / numpy.sqrt(20 + (lbar - 50) ** 2)
+    sc = 1 + 0.045 * cbar
+    sh = 1 + 0.015 * cbar * t
+    rt = -numpy.sin(numpy.radians(2 * dtheta)) * rc
+    dl = dl / sl
+    dc = dc / sc
+    dh = dh / sh
+    return numpy.sqrt(dl * dl + dc * dc + dh * dh + rt * dc * dh)
+
+
+
+def _benchmark(colordb, count=10000, seed=0):
+    # compare the indexed nearest() against the exhaustive scan on random
+    # queries, making sure they always agree
+    import random
+    import time
+    rand = random.Random(seed)
+    queries = [(rand.randrange(256), rand.randrange(256), rand.randrange(256))
+               for i in range(count)]
+    t0 = time.perf_counter()
+    indexed = [colordb.nearest(r, g, b) for r, g, b in queries]
+    t1 = time.perf_counter()
+    exhaustive = [colordb._exhaustive_nearest(r, g, b) for r, g, b in queries]
+    t2 = time.perf_counter()
+    for q, n1, n2 in zip(queries, indexed, exhaustive):
+        if n1 != n2:
+            print('mismatch for', q, ':', n1, '!=', n2, file=sys.stderr)
+    print('%d nearest() queries: indexed %.3fs, exhaustive %.3fs (%.1fx)' %
+          (count, t1 - t0, t2 - t1, (t2 - t1) / (t1 - t0)))
+    # the perceptual metrics, relative to the indexed rgb search
+    for metric in METRICS[1:]:
+        colordb.nearest(0, 0, 0, metric=metric)
+        t2 = time.perf_counter()
+        for r, g, b in queries:
+            colordb.nearest(r, g, b, metric=metric)
+        t3 = time.perf_counter()
+        print('%d nearest() queries: %s %.3fs (%.1fx rgb)' %
+              (count, metric, t3 - t2, (t3 - t2) / (t1 - t0)))
+
+
+
+def _test_merged(files):
+    # every entry of the merged database must be found again by its own
+    # triplet, by each of its names, and by nearest()
+    dbset = ColorDBSet()
+    for file in files:
+        dbset.load(file)
+    merged = dbset.merged()
+    for name in merged.palette():
+        rgb = merged.find_byname(name)
+        assert merged.find_byrgb(rgb)[0] == name, (name, rgb)
+        assert merged.nearest(*rgb) == name, (name, rgb)
+        for alias in merged.aliases_of(*rgb):
+            assert merged.find_byname(alias) == rgb, (alias, rgb)
+    print('%d merged colors from %d databases check out' %
+          (len(merged.palette()), len(dbset.sources())))
+
+
 
 if __name__ == '__main__':
-    colordb = get_colordb('/usr/openwin/lib/rgb.txt')
+    if len(sys.argv) > 1:
+        dbfile = sys.argv[1]
+    else:
+        dbfile = '/usr/openwin/lib/rgb.txt'
+    colordb = get_colordb(dbfile)
     if not colordb:
         print('No parseable color database found')
         sys.exit(1)
@@ -263,6 +1271,12 @@ if __name__ == '__main__':
     nearest = colordb.nearest(r, g, b)
     t1 = time.time()
     print('found nearest color', nearest, 'in', t1-t0, 'seconds')
+    _benchmark(colordb)
+    # merge it with the databases that come with Pynche
+    here = os.path.dirname(os.path.abspath(__file__))
+    _test_merged([dbfile] + [os.path.join(here, file)
+                             for file in sorted(os.listdir(here))
+                             if file.endswith('.txt')])
     # dump the database
     for n in colordb.unique_names():
         r, g, b = colordb.find_byname(n)
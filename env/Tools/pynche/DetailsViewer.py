@@ -166,6 +166,9 @@ class DetailsViewer:
     def deiconify(self, event=None):
         self.__root.deiconify()
 
+    def viewable(self):
+        return self.__root.state() != 'withdrawn'
+
     def __minus25(self, event=None):
         self.__delta(-25)
 
@@ -13,18 +13,29 @@ is an r/g/b value without a name, no scrolling occurs.
 
 You can turn off Update On Click if all you want to see is the alias for a
 given name, without selecting the color.
+
+Only the rows that are scrolled into view have canvas items.  A small pool of
+items is recycled as the list is scrolled, so opening the window costs about
+the same no matter how large the color database is.
 """
 
+import heapq
 from tkinter import *
+from tkinter.font import Font
 import ColorDB
 
 ADDTOVIEW = 'Color %List Window...'
 
+# height of each row in the list, in pixels
+ROWHEIGHT = 20
+# the box around each name is sized to fit the widest of this many of the
+# longest names
+MEASURED = 20
+
 class ListViewer:
     def __init__(self, switchboard, master=None):
         self.__sb = switchboard
         optiondb = switchboard.optiondb()
-        self.__lastbox = None
         self.__dontcenter = 0
         # GUI
         root = self.__root = Toplevel(master, class_='Pynche')
@@ -45,8 +56,10 @@ class ListViewer:
         self.__scrollbar = Scrollbar(frame)
         self.__scrollbar.pack(fill=Y, side=RIGHT)
         canvas.pack(fill=BOTH, expand=1)
-        canvas.configure(yscrollcommand=(self.__scrollbar, 'set'))
+        canvas.configure(yscrollcommand=self.__yscroll)
         self.__scrollbar.configure(command=(canvas, 'yview'))
+        canvas.bind('<ButtonRelease>', self.__onrelease)
+        canvas.bind('<Configure>', self.__render)
         self.__populate()
         #
         # Update on click
@@ -66,57 +79,104 @@ class ListViewer:
         self.__aliases.pack(expand=1, fill=BOTH)
 
     def __populate(self):
-        #
-        # create all the buttons
         colordb = self.__sb.colordb()
         canvas = self.__canvas
-        row = 0
+        self.__names = colordb.unique_names()
+        # key is name, value is its row.  built on demand
+        self.__rows = None
+        self.__selected = None
+        # the pool of (swatch, text, box) items, and the row each shows
+        self.__items = []
+        self.__itemrows = []
+        # find the width of the widest name from the font metrics of the
+        # longest ones, rather than by laying out every name
+        probe = canvas.create_text(0, 0, text='')
+        font = Font(canvas, font=canvas.itemcget(probe, 'font'))
+        canvas.delete(probe)
         widest = 0
-        bboxes = self.__bboxes = []
-        for name in colordb.unique_names():
-            exactcolor = ColorDB.triplet_to_rrggbb(colordb.find_byname(name))
-            canvas.create_rectangle(5, row*20 + 5,
-                                    20, row*20 + 20,
-                                    fill=exactcolor)
-            textid = canvas.create_text(25, row*20 + 13,
-                                        text=name,
-                                        anchor=W)
-            x1, y1, textend, y2 = canvas.bbox(textid)
-            boxid = canvas.create_rectangle(3, row*20+3,
-                                            textend+3, row*20 + 23,
-                                            outline='',
-                                            tags=(exactcolor, 'all'))
-            canvas.bind('<ButtonRelease>', self.__onrelease)
-            bboxes.append(boxid)
-            if textend+3 > widest:
-                widest = textend+3
-            row += 1
-        canvheight = (row-1)*20 + 25
+        for name in heapq.nlargest(MEASURED, self.__names, key=len):
+            widest = max(widest, font.measure(name))
+        self.__widest = 25 + widest + 3
+        canvheight = (len(self.__names)-1)*ROWHEIGHT + 25
         canvas.config(scrollregion=(0, 0, 150, canvheight))
-        for box in bboxes:
-            x1, y1, x2, y2 = canvas.coords(box)
-            canvas.coords(box, x1, y1, widest, y2)
+        self.__render()
+
+    def __yscroll(self, first, last):
+        self.__scrollbar.set(first, last)
+        self.__render()
+
+    def __render(self, event=None):
+        # make sure the rows that are in view are shown, recycling the items
+        # of rows that scrolled out of view.  row i is shown by the items in
+        # slot i % len(self.__items).
+        canvas = self.__canvas
+        colordb = self.__sb.colordb()
+        height = canvas.winfo_height()
+        if height <= 1:
+            # not mapped yet
+            height = int(canvas['height'])
+        first = max(int(canvas.canvasy(0)) // ROWHEIGHT, 0)
+        last = min(int(canvas.canvasy(height)) // ROWHEIGHT + 1,
+                   len(self.__names))
+        items = self.__items
+        if len(items) < last - first:
+            # the window grew, so rows move to new slots.  the old slots keep
+            # their rows, so that those no longer in view get hidden below
+            while len(items) < last - first:
+                items.append((
+                    canvas.create_rectangle(0, 0, 0, 0),
+                    canvas.create_text(0, 0, anchor=W),
+                    canvas.create_rectangle(0, 0, 0, 0, outline='')))
+            self.__itemrows += [None] * (len(items) - len(self.__itemrows))
+        itemrows = self.__itemrows
+        for row in range(first, last):
+            slot = row % len(items)
+            swatch, text, box = items[slot]
+            if itemrows[slot] != row:
+                name = self.__names[row]
+                exactcolor = ColorDB.triplet_to_rrggbb(
+                    colordb.find_byname(name))
+                y = row * ROWHEIGHT
+                canvas.coords(swatch, 5, y + 5, 20, y + 20)
+                canvas.itemconfigure(swatch, fill=exactcolor, state=NORMAL)
+                canvas.coords(text, 25, y + 13)
+                canvas.itemconfigure(text, text=name, state=NORMAL)
+                canvas.coords(box, 3, y + 3, self.__widest, y + 23)
+                canvas.itemconfigure(box, state=NORMAL)
+                itemrows[slot] = row
+            if row == self.__selected:
+                canvas.itemconfigure(box, outline='black')
+            else:
+                canvas.itemconfigure(box, outline='')
+        # hide the slots that have nothing to show, e.g. at the list's end
+        shown = {row % len(items) for row in range(first, last)}
+        for slot, row in enumerate(itemrows):
+            if slot not in shown and row is not None:
+                for item in items[slot]:
+                    canvas.itemconfigure(item, state=HIDDEN)
+                itemrows[slot] = None
+
+    def __row_of(self, red, green, blue):
+        if self.__rows is None:
+            self.__rows = {}
+            for row, name in enumerate(self.__names):
+                self.__rows[name] = row
+        try:
+            name = self.__sb.colordb().find_byrgb((red, green, blue))[0]
+        except ColorDB.BadColor:
+            return None
+        return self.__rows.get(name)
 
     def __onrelease(self, event=None):
         canvas = self.__canvas
-        # find the current box
+        # find the row under the pointer
         x = canvas.canvasx(event.x)
         y = canvas.canvasy(event.y)
-        ids = canvas.find_overlapping(x, y, x, y)
-        for boxid in ids:
-            if boxid in self.__bboxes:
-                break
-        else:
-##            print 'No box found!'
-            return
-        tags = self.__canvas.gettags(boxid)
-        for t in tags:
-            if t[0] == '#':
-                break
-        else:
-##            print 'No color tag found!'
+        row = int(y) // ROWHEIGHT
+        if not (3 <= x <= self.__widest and 0 <= row < len(self.__names)):
             return
-        red, green, blue = ColorDB.rrggbb_to_triplet(t)
+        colordb = self.__sb.colordb()
+        red, green, blue = colordb.find_byname(self.__names[row])
         self.__dontcenter = 1
         if self.__uoc.get():
             self.__sb.update_views(red, green, blue)
@@ -137,21 +197,20 @@ class ListViewer:
     def deiconify(self, event=None):
         self.__root.deiconify()
 
+    def viewable(self):
+        return self.__root.state() != 'withdrawn'
+
     def update_yourself(self, red, green, blue):
         canvas = self.__canvas
-        # turn off the last box
-        if self.__lastbox:
-            canvas.itemconfigure(self.__lastbox, outline='')
-        # turn on the current box
-        colortag = ColorDB.triplet_to_rrggbb((red, green, blue))
-        canvas.itemconfigure(colortag, outline='black')
-        self.__lastbox = colortag
+        # highlight the current color's row, if it has one
+        row = self.__selected = self.__row_of(red, green, blue)
         # fill the aliases
         self.__aliases.delete(0, END)
         try:
             aliases = self.__sb.colordb().aliases_of(red, green, blue)[1:]
         except ColorDB.BadColor:
             self.__aliases.insert(END, '<no matching color>')
+            self.__render()
             return
         if not aliases:
             self.__aliases.insert(END, '<no aliases>')
@@ -161,11 +220,12 @@ class ListViewer:
         # maybe scroll the canvas so that the item is visible
         if self.__dontcenter:
             self.__dontcenter = 0
-        else:
-            ig, ig, ig, y1 = canvas.coords(colortag)
-            ig, ig, ig, y2 = canvas.coords(self.__bboxes[-1])
+        elif row is not None:
+            y1 = row*ROWHEIGHT + 23
+            y2 = (len(self.__names)-1)*ROWHEIGHT + 23
             h = int(canvas['height']) * 0.5
             canvas.yview('moveto', (y1-h) / y2)
+        self.__render()
 
     def save_options(self, optiondb):
         optiondb['UPONCLICK'] = self.__uoc.get()
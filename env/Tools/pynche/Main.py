@@ -14,7 +14,7 @@ days, too many other systems have the acronym `ICE'.
 
 This program currently requires Python 2.2 with Tkinter.
 
-Usage: %(PROGRAM)s [-d file] [-i file] [-X] [-v] [-h] [initialcolor]
+Usage: %(PROGRAM)s [-d file] [-i file] [-X] [-t] [-v] [-h] [initialcolor]
 
 Where:
     --database file
@@ -34,6 +34,10 @@ Where:
         Ignore the initialization file when starting up.  Pynche will still
         write the current option settings to this file when it quits.
 
+    --timings
+    -t
+        When Pynche quits, print how long each viewer spent updating itself.
+
     --version
     -v
         print the version number and exit
@@ -184,8 +188,9 @@ def main():
     try:
         opts, args = getopt.getopt(
             sys.argv[1:],
-            'hd:i:Xv',
-            ['database=', 'initfile=', 'ignore', 'help', 'version'])
+            'hd:i:Xtv',
+            ['database=', 'initfile=', 'ignore', 'timings', 'help',
+             'version'])
     except getopt.error as msg:
         usage(1, msg)
 
@@ -197,6 +202,7 @@ def main():
         usage(1)
 
     ignore = False
+    timings = False
     dbfile = None
     initfile = os.path.expanduser('~/.pynche')
     for opt, arg in opts:
@@ -215,6 +221,8 @@ Version: %(__version__)s""" % globals())
             ignore = True
         elif opt in ('-i', '--initfile'):
             initfile = arg
+        elif opt in ('-t', '--timings'):
+            timings = True
 
     app, sb = build(initialcolor=initialcolor,
                     initfile=initfile,
@@ -222,6 +230,8 @@ Version: %(__version__)s""" % globals())
                     dbfile=dbfile)
     run(app, sb)
     sb.save_views()
+    if timings:
+        sb.dump_timings()
 
 
 
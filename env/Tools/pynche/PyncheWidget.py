@@ -47,6 +47,8 @@ class PyncheWidget:
                 tkroot = self.__tkroot = Tk(className='Pynche')
             # but this isn't our top level widget, so make it invisible
             tkroot.withdraw()
+        # from now on, let the switchboard batch view updates until Tk is idle
+        switchboard.set_tkroot(tkroot)
         # create the menubar
         menubar = self.__menubar = Menu(tkroot)
         #
@@ -56,6 +58,15 @@ class PyncheWidget:
         filemenu.add_command(label='Load palette...',
                              command=self.__load,
                              underline=0)
+        # switch between the palettes loaded so far
+        palettemenu = self.__palettemenu = Menu(filemenu, tearoff=0)
+        self.__palettevar = StringVar()
+        filemenu.add_cascade(label='Palettes',
+                             menu=palettemenu,
+                             underline=0)
+        self.__update_palettes()
+        # however the database changes, keep the menu up to date
+        switchboard.add_colordb_callback(self.__colordb_changed)
         if not modal:
             filemenu.add_command(label='Quit',
                                  command=self.__quit,
@@ -177,7 +188,7 @@ email:   bwarsaw@python.org''' % __version__)
                 # cancel button
                 return
             try:
-                colordb = ColorDB.get_colordb(file)
+                colordb = self.__sb.colordbs().load(file)
             except IOError:
                 messagebox.showerror('Read error', '''\
 Could not open file for reading:
@@ -191,6 +202,33 @@ Unrecognized color file type in file:
             break
         self.__sb.set_colordb(colordb)
 
+    def __colordb_changed(self, colordb):
+        self.__update_palettes()
+
+    def __update_palettes(self):
+        menu = self.__palettemenu
+        menu.delete(0, END)
+        sources = self.__sb.colordbs().sources()
+        for source in sources:
+            menu.add_radiobutton(label=os.path.basename(source),
+                                 variable=self.__palettevar,
+                                 value=source,
+                                 command=self.__select_palette)
+        if len(sources) > 1:
+            menu.add_separator()
+            menu.add_radiobutton(label='All palettes',
+                                 variable=self.__palettevar,
+                                 value='',
+                                 command=self.__select_palette)
+        colordb = self.__sb.colordb()
+        if isinstance(colordb, ColorDB.MergedColorDB):
+            self.__palettevar.set('')
+        elif colordb is not None:
+            self.__palettevar.set(colordb.filename())
+
+    def __select_palette(self):
+        self.__sb.select_colordb(self.__palettevar.get() or None)
+
     def withdraw(self):
         self.__root.withdraw()
 
@@ -279,6 +317,7 @@ class PopupViewer:
             self.__window = class_(self.__sb, self.__root)
             self.__sb.add_view(self.__window)
         self.__window.deiconify()
+        self.__sb.refresh_view(self.__window)
 
     def __eq__(self, other):
         return self.__menutext == other.__menutext
@@ -0,0 +1,337 @@
+"""Quantize -- map the pixels of an image to named colors.
+
+This runs without Tk.  The image is read in stripes of rows, every pixel is
+mapped to the nearest color in a Pynche color database, and a histogram of
+the color names used is printed, most common first.  Optionally the image
+with each pixel replaced by its named color is written out too.
+
+Binary PPM (P6) images are streamed, so memory use is bounded by the stripe
+size no matter how large the image is.  Other formats, such as PNG, are read
+with Pillow if it is installed; Pillow decodes the whole image up front.
+
+Usage: %(PROGRAM)s [-d file] [-m metric] [-o file] [-j jobs] [-r rows] [-l]
+                   [-h] image
+
+Where:
+    --database file
+    -d file
+        Color database file to use.  The default is the X11R6.4 rgb.txt file
+        which comes with Pynche.
+
+    --metric metric
+    -m metric
+        Distance metric used to find the nearest color, one of %(METRICS)s.
+        The default is rgb.
+
+    --output file
+    -o file
+        Write the quantized image to file, as a binary PPM.
+
+    --jobs n
+    -j n
+        Number of worker processes that map stripes.  The default is the
+        number of CPUs; 1 maps everything in this process.
+
+    --rows n
+    -r n
+        Number of rows in each stripe (default %(ROWS)s).
+
+    --lut
+    -l
+        Use (building it the first time) the database's lookup table for
+        nearest colors.  Only used with the rgb metric.
+
+    --help
+    -h
+        print this message
+"""
+
+import sys
+import os
+import getopt
+import tempfile
+import collections
+import concurrent.futures
+import ColorDB
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+
+PROGRAM = sys.argv[0]
+METRICS = ', '.join(ColorDB.METRICS)
+ROWS = 64
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'X', 'rgb.txt')
+
+
+def usage(code, msg=''):
+    print(__doc__ % globals())
+    if msg:
+        print(msg)
+    sys.exit(code)
+
+
+
+class PPMReader:
+    """Read a binary PPM image a stripe of rows at a time."""
+
+    def __init__(self, fp):
+        self.__fp = fp
+        if self.__token() != b'P6':
+            raise ValueError('not a binary PPM file')
+        self.width = int(self.__token())
+        self.height = int(self.__token())
+        if int(self.__token()) != 255:
+            raise ValueError('only 8-bit PPM files are supported')
+        # exactly one whitespace character separates the header and data,
+        # and __token() has already consumed it
+
+    def __token(self):
+        token = b''
+        while True:
+            c = self.__fp.read(1)
+            if not c:
+                break
+            if c == b'#' and not token:
+                self.__fp.readline()
+            elif c.isspace():
+                if token:
+                    break
+            else:
+                token += c
+        return token
+
+    def stripes(self, rows):
+        size = self.width * 3
+        for y in range(0, self.height, rows):
+            n = min(rows, self.height - y)
+            data = self.__fp.read(size * n)
+            if len(data) != size * n:
+                raise ValueError('truncated PPM file')
+            yield data
+
+
+class PILReader:
+    """Read any image Pillow understands, a stripe of rows at a time."""
+
+    def __init__(self, filename):
+        self.__image = Image.open(filename).convert('RGB')
+        self.width, self.height = self.__image.size
+
+    def stripes(self, rows):
+        for y in range(0, self.height, rows):
+            box = (0, y, self.width, min(y + rows, self.height))
+            yield self.__image.crop(box).tobytes()
+
+
+def open_image(filename):
+    fp = open(filename, 'rb')
+    try:
+        if fp.read(2) == b'P6':
+            fp.seek(0)
+            return fp, PPMReader(fp)
+    except:
+        fp.close()
+        raise
+    fp.close()
+    if Image is None:
+        raise ValueError('Pillow is needed to read non-PPM images')
+    return None, PILReader(filename)
+
+
+
+# Each worker process loads the color database once, in init_worker().
+_colordb = None
+_rgbtable = None
+_metric = 'rgb'
+
+def init_worker(dbfile, metric='rgb', lut=False, lutfile=None):
+    global _colordb, _rgbtable, _metric
+    _colordb = ColorDB.get_colordb(dbfile)
+    if _colordb is None:
+        raise ValueError('unrecognized color database: %s' % dbfile)
+    if lutfile is not None:
+        # the parent has already built the table, so only map it
+        _colordb.load_lut(lutfile, build=False)
+    elif lut and metric == 'rgb':
+        _colordb.load_lut()
+    _metric = metric
+    # the rgb bytes of every palette entry, for writing remapped stripes
+    _rgbtable = [bytes(_colordb.find_byname(name))
+                 for name in _colordb.palette()]
+    if ColorDB.numpy is not None:
+        _rgbtable = ColorDB.numpy.frombuffer(b''.join(_rgbtable),
+                                             dtype=ColorDB.numpy.uint8)
+        _rgbtable = _rgbtable.reshape(-1, 3)
+
+
+def share_lut(dbfile, tmpdir):
+    """Build or map the lookup table once, for worker processes to map.
+
+    Returns the name of the file holding the table: the database's own
+    `.lut' file, or one in tmpdir if that can't be written.  Returns None if
+    the database can't have a table.
+    """
+    colordb = ColorDB.get_colordb(dbfile)
+    if colordb is None:
+        raise ValueError('unrecognized color database: %s' % dbfile)
+    lutfile = dbfile + '.lut'
+    if colordb.load_lut(lutfile, build=False):
+        return lutfile
+    if not os.access(os.path.dirname(os.path.abspath(lutfile)), os.W_OK):
+        lutfile = os.path.join(tmpdir, os.path.basename(lutfile))
+    if not colordb.load_lut(lutfile):
+        return None
+    return lutfile
+
+
+def map_stripe(data, remap=False):
+    """Return the palette histogram of a stripe, and maybe its remapping.
+
+    The histogram is a dictionary mapping palette indices to pixel counts.
+    """
+    indices = _colordb.nearest_many(data, indices=True, metric=_metric)
+    remapped = None
+    if ColorDB.numpy is not None:
+        counts = ColorDB.numpy.bincount(indices)
+        histogram = {int(i): int(counts[i]) for i in counts.nonzero()[0]}
+        if remap:
+            remapped = _rgbtable[indices].tobytes()
+    else:
+        histogram = collections.Counter(indices)
+        if remap:
+            table = _rgbtable
+            remapped = b''.join([table[i] for i in indices])
+    return histogram, remapped
+
+
+def quantize(filename, dbfile, outfile=None, metric='rgb', jobs=None,
+             rows=ROWS, lut=False):
+    """Quantize an image, returning a list of (count, name), most first."""
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    fp, reader = open_image(filename)
+    out = None
+    histogram = collections.Counter()
+    try:
+        if outfile is not None:
+            out = open(outfile, 'wb')
+            out.write(b'P6\n%d %d\n255\n' % (reader.width, reader.height))
+
+        def collect(result):
+            counts, remapped = result
+            histogram.update(counts)
+            if out is not None:
+                out.write(remapped)
+
+        if jobs == 1:
+            init_worker(dbfile, metric, lut)
+            for data in reader.stripes(rows):
+                collect(map_stripe(data, out is not None))
+        else:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                # build or map the lookup table here, before the workers
+                # start, so that each of them only maps it
+                lutfile = None
+                if lut and metric == 'rgb':
+                    lutfile = share_lut(dbfile, tmpdir)
+                with concurrent.futures.ProcessPoolExecutor(
+                        jobs, initializer=init_worker,
+                        initargs=(dbfile, metric, lut, lutfile)) as pool:
+                    # keep only a couple of stripes per worker in flight,
+                    # so memory stays bounded, and collect them in image
+                    # order
+                    pending = collections.deque()
+                    for data in reader.stripes(rows):
+                        if len(pending) >= 2 * jobs:
+                            collect(pending.popleft().result())
+                        pending.append(pool.submit(map_stripe, data,
+                                                   out is not None))
+                    while pending:
+                        collect(pending.popleft().result())
+    finally:
+        if fp is not None:
+            fp.close()
+        if out is not None:
+            out.close()
+    if jobs == 1:
+        colordb = _colordb
+    else:
+        colordb = ColorDB.get_colordb(dbfile)
+    names = colordb.palette()
+    return sorted(((count, names[i]) for i, count in histogram.items()),
+                  key=lambda item: (-item[0], item[1]))
+
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            'hd:m:o:j:r:l',
+            ['database=', 'metric=', 'output=', 'jobs=', 'rows=', 'lut',
+             'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+
+    if len(args) != 1:
+        usage(1)
+
+    dbfile = DEFAULT_DB
+    metric = 'rgb'
+    outfile = None
+    jobs = None
+    rows = ROWS
+    lut = False
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-d', '--database'):
+            dbfile = arg
+        elif opt in ('-m', '--metric'):
+            if arg not in ColorDB.METRICS:
+                usage(1, 'Bad metric: %s' % arg)
+            metric = arg
+        elif opt in ('-o', '--output'):
+            outfile = arg
+        elif opt in ('-j', '--jobs'):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                usage(1, 'Bad number of jobs: %s' % arg)
+        elif opt in ('-r', '--rows'):
+            try:
+                rows = int(arg)
+            except ValueError:
+                rows = 0
+            if rows < 1:
+                usage(1, 'Bad number of rows: %s' % arg)
+        elif opt in ('-l', '--lut'):
+            lut = True
+
+    try:
+        histogram = quantize(args[0], dbfile, outfile, metric, jobs, rows,
+                             lut)
+    except (OSError, ValueError) as e:
+        usage(1, e)
+    try:
+        for count, name in histogram:
+            print('%10d  %s' % (count, name))
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader, say head, has gone; point stdout at /dev/null so that
+        # flushing it again at exit doesn't complain too
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+
+if __name__ == '__main__':
+    main()
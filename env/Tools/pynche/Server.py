@@ -0,0 +1,397 @@
+"""Server -- answer color database lookups over a socket.
+
+This runs without Tk.  The color databases are loaded once, when the server
+starts, and then lookups are answered over a local TCP (or Unix domain)
+socket, which saves clients from parsing the database on every call.
+
+The protocol is one JSON object per line in each direction.  A request looks
+like
+
+    {"id": 1, "op": "nearest", "arg": [250, 128, 114]}
+
+where op is one of find_byname, find_byrgb, nearest or aliases_of, and arg is
+a color name for find_byname and a [red, green, blue] list for the others.
+Optional keys are "db", the file name (or just the base name) of the database
+to use, which defaults to the first one given, and "metric", the distance
+metric for nearest.  The answer is
+
+    {"id": 1, "result": "salmon"}
+
+or {"id": 1, "error": "..."} if the request failed.  The id is just copied
+from the request.  Instead of "arg", a request can have "batch", a list of
+arguments.  The answer to a batch is a list of results, with null for colors
+that aren't found.  Batches are handed to a pool of worker processes, so large
+ones don't hold up other clients.
+
+Usage: %(PROGRAM)s [-d file]... [-H host] [-p port] [-u path] [-j jobs]
+       %(PROGRAM)s -b [-H host] [-p port] [-u path] [-c clients] [-n requests]
+                     [-B batchsize]
+
+Where:
+    --database file
+    -d file
+        Color database to serve.  Give this more than once to serve several
+        databases.  The default is the X11R6.4 rgb.txt file which comes with
+        Pynche.
+
+    --host host
+    -H host
+        Host address to listen on, or connect to (default %(HOST)s).
+
+    --port port
+    -p port
+        TCP port to listen on, or connect to (default %(PORT)s).
+
+    --unix path
+    -u path
+        Use the Unix domain socket at path instead of TCP.
+
+    --jobs n
+    -j n
+        Number of worker processes for batch requests.  The default is the
+        number of CPUs; 0 answers batches in the server process.
+
+    --bench
+    -b
+        Instead of serving, run a load generator against a running server
+        and print the throughput and latencies.
+
+    --clients n
+    -c n
+        Number of concurrent load generator clients (default 8).
+
+    --requests n
+    -n n
+        Number of requests each load generator client sends (default 1000).
+
+    --batch n
+    -B n
+        Make the load generator send nearest batches of n colors instead of
+        single lookups.
+
+    --help
+    -h
+        print this message
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import getopt
+import asyncio
+import concurrent.futures
+import ColorDB
+
+
+
+PROGRAM = sys.argv[0]
+HOST = '127.0.0.1'
+PORT = 7040
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'X', 'rgb.txt')
+
+OPERATIONS = ('find_byname', 'find_byrgb', 'nearest', 'aliases_of')
+
+# Longest request or response line; batches of colors make long lines, so
+# this is far above asyncio's default of 64 KiB.  Longer requests get an
+# error answer.
+LIMIT = 64 * 1024 * 1024
+
+
+def usage(code, msg=''):
+    print(__doc__ % globals())
+    if msg:
+        print(msg)
+    sys.exit(code)
+
+
+def intarg(arg, what, low, high=None):
+    """Return the option argument arg as an int from low to high.
+
+    Anything else exits with the usage message.
+    """
+    try:
+        n = int(arg)
+    except ValueError:
+        n = None
+    if n is None or n < low or (high is not None and n > high):
+        usage(1, 'Bad %s: %s' % (what, arg))
+    return n
+
+
+
+def load_colordbs(dbfiles):
+    """Return a dictionary of the loaded databases.
+
+    Each database is stored under its file name as given and under its base
+    name.
+    """
+    colordbs = {}
+    for file in dbfiles:
+        colordb = ColorDB.get_colordb(file)
+        if colordb is None:
+            raise ValueError('unrecognized color database: %s' % file)
+        colordbs[file] = colordb
+        colordbs.setdefault(os.path.basename(file), colordb)
+    return colordbs
+
+
+def lookup(colordb, op, arg, metric='rgb'):
+    """Do one lookup, returning something JSON can encode."""
+    if op == 'find_byname':
+        return list(colordb.find_byname(arg))
+    if op == 'find_byrgb':
+        name, aliases = colordb.find_byrgb(tuple(arg))
+        return [name, aliases]
+    if op == 'nearest':
+        red, green, blue = arg
+        return colordb.nearest(red, green, blue, metric=metric)
+    if op == 'aliases_of':
+        red, green, blue = arg
+        return colordb.aliases_of(red, green, blue)
+    raise ValueError('unknown operation: %s' % op)
+
+
+def lookup_batch(colordb, op, batch, metric='rgb'):
+    if op == 'nearest':
+        return colordb.nearest_many(batch, metric=metric)
+    results = []
+    for arg in batch:
+        try:
+            results.append(lookup(colordb, op, arg, metric))
+        except ColorDB.BadColor:
+            results.append(None)
+    return results
+
+
+
+# Each worker process loads the databases once, in init_worker().
+_colordbs = None
+
+def init_worker(dbfiles):
+    global _colordbs
+    _colordbs = load_colordbs(dbfiles)
+
+
+def run_batch(db, op, batch, metric):
+    return lookup_batch(_colordbs[db], op, batch, metric)
+
+
+class ColorServer:
+    def __init__(self, dbfiles, jobs=None):
+        self.__colordbs = load_colordbs(dbfiles)
+        self.__default = dbfiles[0]
+        self.__pool = None
+        if jobs != 0:
+            self.__pool = concurrent.futures.ProcessPoolExecutor(
+                jobs, initializer=init_worker, initargs=(dbfiles,))
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.shutdown()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await self.__readline(reader)
+                if line is None:
+                    response = {'id': None,
+                                'error': 'bad request: longer than %d bytes'
+                                         % LIMIT}
+                elif not line:
+                    break
+                else:
+                    response = await self.__answer(line)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def __readline(self, reader):
+        """Return the next line, b'' at the end, or None if it's too long.
+
+        The rest of a line that is too long is skipped.
+        """
+        try:
+            return await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+        while True:
+            await reader.readexactly(consumed)
+            try:
+                await reader.readuntil(b'\n')
+                return None
+            except asyncio.IncompleteReadError:
+                return None
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    async def __answer(self, line):
+        response = {}
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            db = request.get('db', self.__default)
+            op = request.get('op')
+            metric = request.get('metric', 'rgb')
+            if db not in self.__colordbs:
+                raise ValueError('unknown database: %s' % db)
+            if op not in OPERATIONS:
+                raise ValueError('unknown operation: %s' % op)
+            if metric not in ColorDB.METRICS:
+                raise ValueError('unknown metric: %s' % metric)
+            if 'batch' in request:
+                batch = request['batch']
+                if self.__pool is None:
+                    result = lookup_batch(self.__colordbs[db], op, batch,
+                                          metric)
+                else:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(
+                        self.__pool, run_batch, db, op, batch, metric)
+            else:
+                result = lookup(self.__colordbs[db], op, request['arg'],
+                                metric)
+            response['result'] = result
+        except ColorDB.BadColor as e:
+            response['error'] = 'no such color: %s' % (e.args[0],)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            response['error'] = 'bad request: %s' % (e,)
+        return response
+
+
+async def serve(dbfiles, host=HOST, port=PORT, path=None, jobs=None):
+    colorserver = ColorServer(dbfiles, jobs)
+    try:
+        if path is not None:
+            server = await asyncio.start_unix_server(colorserver.handle, path,
+                                                     limit=LIMIT)
+        else:
+            server = await asyncio.start_server(colorserver.handle, host,
+                                                port, limit=LIMIT)
+        async with server:
+            await server.serve_forever()
+    finally:
+        colorserver.close()
+
+
+
+async def _client(host, port, path, requests, batchsize, latencies, seed):
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path,
+                                                            limit=LIMIT)
+    else:
+        reader, writer = await asyncio.open_connection(host, port,
+                                                       limit=LIMIT)
+    rand = random.Random(seed)
+    names = ['navy', 'salmon', 'gray50', 'LightGoldenrod', 'no such color']
+    for i in range(requests):
+        if batchsize:
+            request = {'op': 'nearest',
+                       'batch': [[rand.randrange(256) for c in range(3)]
+                                 for j in range(batchsize)]}
+        elif i % 2:
+            request = {'op': 'find_byname', 'arg': rand.choice(names)}
+        else:
+            request = {'op': 'nearest',
+                       'arg': [rand.randrange(256) for c in range(3)]}
+        request['id'] = i
+        t0 = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - t0)
+        if response.get('id') != i:
+            raise ValueError('mismatched response: %r' % (response,))
+    writer.close()
+
+
+async def loadgen(host=HOST, port=PORT, path=None, clients=8,
+                  requests=1000, batchsize=0):
+    """Hammer a running server, returning a dictionary of statistics."""
+    latencies = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, path, requests, batchsize, latencies, seed)
+        for seed in range(clients)])
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'colors': len(latencies) * (batchsize or 1),
+        'seconds': elapsed,
+        'requests/s': len(latencies) / elapsed,
+        'p50 ms': latencies[len(latencies) // 2] * 1000,
+        'p99 ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        }
+
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            'hd:H:p:u:j:bc:n:B:',
+            ['database=', 'host=', 'port=', 'unix=', 'jobs=', 'bench',
+             'clients=', 'requests=', 'batch=', 'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+
+    if args:
+        usage(1)
+
+    dbfiles = []
+    host = HOST
+    port = PORT
+    path = None
+    jobs = None
+    bench = False
+    clients = 8
+    requests = 1000
+    batchsize = 0
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-d', '--database'):
+            dbfiles.append(arg)
+        elif opt in ('-H', '--host'):
+            host = arg
+        elif opt in ('-p', '--port'):
+            port = intarg(arg, 'port', 0, 65535)
+        elif opt in ('-u', '--unix'):
+            path = arg
+        elif opt in ('-j', '--jobs'):
+            jobs = intarg(arg, 'number of jobs', 0)
+        elif opt in ('-b', '--bench'):
+            bench = True
+        elif opt in ('-c', '--clients'):
+            clients = intarg(arg, 'number of clients', 1)
+        elif opt in ('-n', '--requests'):
+            requests = intarg(arg, 'number of requests', 1)
+        elif opt in ('-B', '--batch'):
+            batchsize = intarg(arg, 'batch size', 1)
+
+    if bench:
+        stats = asyncio.run(loadgen(host, port, path, clients, requests,
+                                    batchsize))
+        for key, value in stats.items():
+            print('%-12s %12.3f' % (key, value))
+        return
+    try:
+        asyncio.run(serve(dbfiles or [DEFAULT_DB], host, port, path, jobs))
+    except (OSError, ValueError) as e:
+        usage(1, e)
+    except KeyboardInterrupt:
+        pass
+
+
+
+if __name__ == '__main__':
+    main()
@@ -24,18 +24,19 @@ select the color under the cursor while you drag it, but be forewarned that
 this can be slow.
 """
 
+import functools
 from tkinter import *
 import ColorDB
 
 # Load this script into the Tcl interpreter and call it in
-# StripWidget.set_color().  This is about as fast as it can be with the
-# current _tkinter.c interface, which doesn't support Tcl Objects.
+# StripWidget.update_yourself().  This is about as fast as it can be with the
+# current _tkinter.c interface, which doesn't support Tcl Objects.  It takes
+# a list of alternating chip numbers and colors, for just the chips whose
+# color changed.
 TCLPROC = '''\
-proc setcolor {canv colors} {
-    set i 1
-    foreach c $colors {
+proc setcolor {canv chips} {
+    foreach {i c} $chips {
         $canv itemconfigure $i -fill $c -outline $c
-        incr i
     }
 }
 '''
@@ -49,6 +50,10 @@ SPACE = ' '
 
 
 
+# number of strips remembered by strip_colors()
+STRIPCACHE = 256
+
+@functools.lru_cache(maxsize=None)
 def constant(numchips):
     step = 255.0 / (numchips - 1)
     start = 0.0
@@ -57,7 +62,7 @@ def constant(numchips):
         seq.append(int(start))
         start = start + step
         numchips = numchips - 1
-    return seq
+    return tuple(seq)
 
 # red variations, green+blue = cyan constant
 def constant_red_generator(numchips, red, green, blue):
@@ -90,6 +95,22 @@ def constant_yellow_generator(numchips, red, green, blue):
     return list(zip([red] * numchips, [green] * numchips, seq))
 
 
+@functools.lru_cache(maxsize=STRIPCACHE)
+def strip_colors(generator, numchips, red, green, blue):
+    """Return the chip colors of a strip, and the selected chip.
+
+    The colors are #rrggbb strings, converted in one batch.  The selected
+    chip is numbered from 1, and is the last one with no component greater
+    than the current color's.
+    """
+    triplets = generator(numchips, red, green, blue)
+    chip = 0
+    for i, (tred, tgreen, tblue) in enumerate(triplets, 1):
+        if tred <= red and tgreen <= green and tblue <= blue:
+            chip = i
+    return tuple(ColorDB.triplets_to_rrggbb(triplets)), chip
+
+
 
 class LeftArrow:
     _ARROWWIDTH = 30
@@ -290,21 +311,19 @@ class StripWidget:
 
     def update_yourself(self, red, green, blue):
         assert self.__generator
-        i = 1
-        chip = 0
-        chips = self.__chips = []
-        tk = self.__canvas.tk
-        # get the red, green, and blue components for all chips
-        for t in self.__generator(self.__numchips, red, green, blue):
-            rrggbb = ColorDB.triplet_to_rrggbb(t)
-            chips.append(rrggbb)
-            tred, tgreen, tblue = t
-            if tred <= red and tgreen <= green and tblue <= blue:
-                chip = i
-            i = i + 1
-        # call the raw tcl script
-        colors = SPACE.join(chips)
-        tk.eval('setcolor %s {%s}' % (self.__canvas._w, colors))
+        colors, chip = strip_colors(self.__generator, self.__numchips,
+                                    red, green, blue)
+        # only the chips whose color changed need to be reconfigured.  for
+        # example, dragging along the red strip never changes its colors.
+        changed = []
+        for i, (old, new) in enumerate(zip(self.__chips, colors), 1):
+            if old != new:
+                changed.append('%d %s' % (i, new))
+        self.__chips = list(colors)
+        if changed:
+            # call the raw tcl script
+            self.__canvas.tk.eval('setcolor %s {%s}' %
+                                  (self.__canvas._w, SPACE.join(changed)))
         # move the arrows around
         self.__trackarrow(chip, (red, green, blue))
 
@@ -25,7 +25,19 @@ Optionally, Viewers can also implement:
     - colordb_changed() which takes a single argument, an instance of
       ColorDB.  This is called whenever the color name database is changed and
       gives a chance for the Viewers to do something on those events.  See
-      ListViewer for details.
+      ListViewer for details.  Every database that has been loaded is kept in
+      a ColorDB.ColorDBSet (see colordbs()), and select_colordb() switches
+      back to any of them, or to all of them merged, without reading files.
+
+    - viewable() which takes no arguments and returns false while the Viewer
+      is withdrawn.  Withdrawn Viewers are not updated until they are shown
+      again with refresh_view().
+
+Once the Switchboard knows the Tk root (see set_tkroot()), update_views() does
+not update the Viewers right away.  The update is done when Tk is next idle,
+so a burst of color changes, such as from dragging in a strip, results in only
+one update of each Viewer, to the last color.  The time every Viewer spends
+updating itself is recorded, and can be printed with dump_timings().
 
 External Viewers are found dynamically.  Viewer modules should have names such
 as FooViewer.py.  If such a named module has a module global variable called
@@ -42,7 +54,10 @@ master window.
 """
 
 import sys
+import os
+import time
 import marshal
+import ColorDB
 
 
 
@@ -50,38 +65,77 @@ class Switchboard:
     def __init__(self, initfile):
         self.__initfile = initfile
         self.__colordb = None
-        self.__optiondb = {}
+        # every database loaded so far, so switching back to one is free
+        self.__colordbs = ColorDB.ColorDBSet()
+        self.__options = OptionStore(initfile)
         self.__views = []
+        # called with the new database by set_colordb()
+        self.__colordb_callbacks = []
         self.__red = 0
         self.__green = 0
         self.__blue = 0
         self.__canceled = 0
-        # read the initialization file
-        fp = None
-        if initfile:
-            try:
-                try:
-                    fp = open(initfile, 'rb')
-                    self.__optiondb = marshal.load(fp)
-                    if not isinstance(self.__optiondb, dict):
-                        print('Problem reading options from file:', initfile,
-                              file=sys.stderr)
-                        self.__optiondb = {}
-                except (IOError, EOFError, ValueError):
-                    pass
-            finally:
-                if fp:
-                    fp.close()
+        self.__tkroot = None
+        self.__pending = None
+        # views skipped because they were withdrawn
+        self.__stale = []
+        # key is the view's class name, value is [count, total, max] seconds
+        self.__timings = {}
 
     def add_view(self, view):
         self.__views.append(view)
 
+    def add_colordb_callback(self, callback):
+        # for things that aren't Viewers but still follow the database, such
+        # as the Palettes menu
+        self.__colordb_callbacks.append(callback)
+
+    def set_tkroot(self, tkroot):
+        self.__tkroot = tkroot
+
     def update_views(self, red, green, blue):
         self.__red = red
         self.__green = green
         self.__blue = blue
+        if self.__tkroot is None:
+            self.__dispatch()
+        elif self.__pending is None:
+            self.__pending = self.__tkroot.after_idle(self.__dispatch)
+
+    def __dispatch(self):
+        self.__pending = None
         for v in self.__views:
-            v.update_yourself(red, green, blue)
+            if hasattr(v, 'viewable') and not v.viewable():
+                if v not in self.__stale:
+                    self.__stale.append(v)
+                continue
+            self.__update_view(v)
+
+    def __update_view(self, view):
+        t0 = time.perf_counter()
+        view.update_yourself(self.__red, self.__green, self.__blue)
+        elapsed = time.perf_counter() - t0
+        timing = self.__timings.setdefault(view.__class__.__name__,
+                                           [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+    def refresh_view(self, view):
+        # bring a view that missed updates while withdrawn up to date
+        if view in self.__stale:
+            self.__stale.remove(view)
+            self.__update_view(view)
+
+    def dump_timings(self, fp=None):
+        if fp is None:
+            fp = sys.stderr
+        print('%-16s %8s %10s %10s %10s' % ('view', 'updates', 'total ms',
+                                            'mean ms', 'max ms'), file=fp)
+        for name, (count, total, longest) in sorted(self.__timings.items()):
+            print('%-16s %8d %10.1f %10.3f %10.3f' %
+                  (name, count, total * 1000, total * 1000 / count,
+                   longest * 1000), file=fp)
 
     def update_views_current(self):
         self.update_views(self.__red, self.__green, self.__blue)
@@ -92,39 +146,48 @@ class Switchboard:
     def colordb(self):
         return self.__colordb
 
+    def colordbs(self):
+        return self.__colordbs
+
     def set_colordb(self, colordb):
+        if not isinstance(colordb, ColorDB.MergedColorDB):
+            self.__colordbs.add(colordb)
         self.__colordb = colordb
         for v in self.__views:
             if hasattr(v, 'colordb_changed'):
                 v.colordb_changed(colordb)
+        for callback in self.__colordb_callbacks:
+            callback(colordb)
         self.update_views_current()
 
+    def select_colordb(self, source=None):
+        """Switch to an already loaded database, or None for all of them."""
+        if source is None:
+            colordb = self.__colordbs.merged()
+        else:
+            colordb = self.__colordbs.get(source)
+        self.set_colordb(colordb)
+
     def optiondb(self):
-        return self.__optiondb
+        return self.__options.options()
 
     def save_views(self):
+        optiondb = self.optiondb()
         # save the current color
-        self.__optiondb['RED'] = self.__red
-        self.__optiondb['GREEN'] = self.__green
-        self.__optiondb['BLUE'] = self.__blue
+        optiondb['RED'] = self.__red
+        optiondb['GREEN'] = self.__green
+        optiondb['BLUE'] = self.__blue
         for v in self.__views:
             if hasattr(v, 'save_options'):
-                v.save_options(self.__optiondb)
+                v.save_options(optiondb)
         # save the name of the file used for the color database.  we'll try to
         # load this first.
-        self.__optiondb['DBFILE'] = self.__colordb.filename()
-        fp = None
+        optiondb['DBFILE'] = self.__colordb.filename()
         try:
-            try:
-                fp = open(self.__initfile, 'wb')
-            except IOError:
-                print('Cannot write options to file:', \
-                      self.__initfile, file=sys.stderr)
-            else:
-                marshal.dump(self.__optiondb, fp)
-        finally:
-            if fp:
-                fp.close()
+            self.__options.save()
+        except (IOError, ValueError) as e:
+            print('Cannot write options to file:', self.__initfile,
+                  '(%s)' % e, file=sys.stderr)
 
     def withdraw_views(self):
         for v in self.__views:
@@ -136,3 +199,127 @@ class Switchboard:
 
     def canceled_p(self):
         return self.__canceled
+
+
+
+
+class OptionStore:
+    """The persistent options (the ~/.pynche file).
+
+    The file holds a sequence of marshaled records.  The first is a
+    dictionary of all the options, as older versions of Pynche wrote.  Each
+    later record is a (changed, deleted) tuple: a dictionary of the options
+    that changed since the previous save, and a list of the options that were
+    removed.  So save() only appends what changed, and writes nothing at all
+    if nothing did.
+
+    A record cut short by a crash is ignored when the file is read.  Once
+    COMPACT records have been appended, or after such a damaged record was
+    found, save() instead writes all the options to a temporary file and
+    renames it over the old one, so the file is never half written.
+
+    The file is not read until options() is first called.
+    """
+
+    COMPACT = 64
+
+    def __init__(self, filename):
+        self.__filename = filename
+        self.__options = None
+        # key is option name, value is its marshaled value as last saved
+        self.__saved = {}
+        # number of records appended since the file was last rewritten
+        self.__records = 0
+        self.__damaged = False
+
+    def options(self):
+        if self.__options is None:
+            self.__options = self.__load()
+            self.__saved = self.__marshal(self.__options)
+        return self.__options
+
+    def __marshal(self, options):
+        return {key: marshal.dumps(value) for key, value in options.items()}
+
+    def __load(self):
+        options = {}
+        if not self.__filename:
+            return options
+        try:
+            fp = open(self.__filename, 'rb')
+        except IOError:
+            return options
+        with fp:
+            size = os.fstat(fp.fileno()).st_size
+            try:
+                options = marshal.load(fp)
+            except (EOFError, ValueError, TypeError):
+                self.__damaged = True
+                return {}
+            if not isinstance(options, dict):
+                print('Problem reading options from file:', self.__filename,
+                      file=sys.stderr)
+                self.__damaged = True
+                return {}
+            while True:
+                offset = fp.tell()
+                try:
+                    record = marshal.load(fp)
+                except EOFError:
+                    # a clean end, or a record cut short
+                    self.__damaged = offset != size
+                    break
+                except (ValueError, TypeError):
+                    self.__damaged = True
+                    break
+                try:
+                    changed, deleted = record
+                    options.update(changed)
+                    for key in deleted:
+                        options.pop(key, None)
+                except (ValueError, TypeError):
+                    self.__damaged = True
+                    break
+                self.__records += 1
+        return options
+
+    def save(self):
+        if not self.__filename or self.__options is None:
+            # nothing was read, so nothing can have changed
+            return
+        current = self.__marshal(self.__options)
+        changed = {key: self.__options[key]
+                   for key, data in current.items()
+                   if self.__saved.get(key) != data}
+        deleted = [key for key in self.__saved if key not in current]
+        if (self.__damaged or self.__records >= self.COMPACT
+                or not os.path.exists(self.__filename)):
+            self.__rewrite()
+        elif changed or deleted:
+            self.__append(marshal.dumps((changed, deleted)))
+            self.__records += 1
+        self.__saved = current
+
+    def __append(self, data):
+        with open(self.__filename, 'ab') as fp:
+            # one write, so a crash leaves at most one short record at the end
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def __rewrite(self):
+        tmpfile = self.__filename + '.tmp'
+        try:
+            with open(tmpfile, 'wb') as fp:
+                marshal.dump(self.__options, fp)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmpfile, self.__filename)
+        except BaseException:
+            try:
+                os.remove(tmpfile)
+            except OSError:
+                pass
+            raise
+        self.__records = 0
+        self.__damaged = False
@@ -124,6 +124,9 @@ and choosing a color.'''))
     def deiconify(self, event=None):
         self.__root.deiconify()
 
+    def viewable(self):
+        return self.__root.state() != 'withdrawn'
+
     def __forceupdate(self, event=None):
         self.__sb.update_views_current()
 